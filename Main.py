@@ -4,8 +4,9 @@ import sys
 import pygame
 import moderngl
 
+from ShaderLIB.ContextLocal import ContextLocal
 from ShaderLIB.Shader import Shader
-from ShaderLIB.ShaderChainer import ShaderChainer
+from ShaderLIB.ShaderChainer import ShaderChainer, ChainPass
 
 from array import array
 
@@ -38,7 +39,8 @@ bg_shader2 = Shader("ShaderLIB/SHADERS/bg_noise_shader2", ctx, screen_size=SCREE
 pixalation_shader = Shader("ShaderLIB/SHADERS/pixalation_shader", ctx, screen_size=SCREEN_SIZE)
 
 pixalation_normal_shader_chain = ShaderChainer([pixalation_shader, default_pipline_shader], ctx, SCREEN_SIZE)
-bg_shaders = ShaderChainer([bg_shader, bg_shader2], ctx, SCREEN_SIZE)
+# bg_noise_shader2 only reads .rgb, the target between them (and its retained copy) drops alpha
+bg_shaders = ShaderChainer([ChainPass(bg_shader, components=3), bg_shader2], ctx, SCREEN_SIZE, memoize=True)
 
 
 fps = 60
@@ -66,7 +68,8 @@ while running:
     #
     # bg_shader2.render_texture(color_texture, flip_y=True, time=t)
 
-    bg_shaders.render(pnois, (0, 0), fbo, [{"color": bg_color, "darkness_mult": 0.5}, {"time": t}])
+    # pnois never changes, the first pass is served from its retained output after a couple of frames
+    bg_shaders.render(pnois, (0, 0), fbo, [{"color": bg_color, "darkness_mult": 0.5}, {"time": t}], dirty_rect=(0, 0, 0, 0))
     #pixalation_normal_shader_chain.render_framebuffer(fbo, args_for_shaders=[{"pixelSize": 200}])
 
     #pixalation_shader.render_frame_buffer(fbo=fbo, pixelSize=1000)
@@ -79,6 +82,8 @@ while running:
     delta_time = clock.tick(fps) / 1000
     delta_time = max(0.001, min(0.1, delta_time))
 
+# Pooled targets, cached programs and surface textures go before the context
+ContextLocal.release_context(ctx)
 ctx.release()
 
 pygame.quit()
@@ -0,0 +1,138 @@
+import argparse
+import multiprocessing
+import os
+import time
+from collections import deque
+
+import moderngl
+import pygame
+
+from .Shader import Shader
+from .ShaderChainer import ShaderChainer
+from .SurfaceTextureCache import SurfaceTextureCache
+
+# Per process state of the pool workers: _init_worker keeps the arguments, the first task builds the _Worker
+_worker = None
+_worker_args = None
+
+
+class _Worker:
+
+    def __init__(self, shader_dirs: list[str], size, args_for_shaders, backend, out_dir, out_format):
+        kwargs = {"backend": backend} if backend else {}
+        self.ctx = moderngl.create_standalone_context(**kwargs)
+        self.size = size
+        self.args_for_shaders = args_for_shaders
+        self.out_dir = out_dir
+        self.out_format = out_format
+        shaders = [Shader(shader_dir, self.ctx, screen_size=size) for shader_dir in shader_dirs]
+        self.chain = ShaderChainer(shaders, self.ctx, size)
+        self.texture = self.ctx.texture(size, 4)
+        self.fbo = self.ctx.framebuffer(color_attachments=[self.texture])
+
+    def render(self, index: int, source, args_for_shaders):
+        surf = BatchRenderer.load_frame(source)
+        if surf.get_size() != self.size:
+            surf = pygame.transform.smoothscale(surf, self.size)
+        self.fbo.clear()
+        self.chain.render(surf, (0, 0), self.fbo, args_for_shaders if args_for_shaders is not None else self.args_for_shaders)
+        # Every frame is a new surface, its texture goes now instead of whenever the surface is collected
+        SurfaceTextureCache.for_context(self.ctx).forget(surf)
+        # The chain leaves the image upright for OpenGL, rows come back bottom to top
+        result = pygame.image.frombytes(self.fbo.read(components=4), self.size, "RGBA", True)
+        if self.out_dir is None:
+            return index, pygame.image.tobytes(result, "RGBA")
+        if isinstance(source, str):
+            name = os.path.splitext(os.path.basename(source))[0]
+        else:
+            name = f"frame_{index:06d}"
+        path = os.path.join(self.out_dir, f"{name}.{self.out_format}")
+        pygame.image.save(result, path)
+        return index, path
+
+
+def _init_worker(*args):
+    # Nothing here may fail: multiprocessing.Pool respawns workers whose initializer raises, forever
+    global _worker_args
+    _worker_args = args
+
+
+def _render_frame(task):
+    # Built inside the task so a context or shader failure comes back to the caller through .get()
+    global _worker
+    if _worker is None:
+        _worker = _Worker(*_worker_args)
+    return _worker.render(*task)
+
+
+class BatchRenderer:
+
+    def __init__(self, shader_dirs: list[str], size, args_for_shaders: list[dict] = None, out_dir: str = None,
+                 processes: int = None, max_in_flight: int = None, backend: str = None, out_format="png"):
+        # backend="egl" renders without an X display, e.g. on Mesa's llvmpipe software rasterizer
+        self.shader_dirs = [os.path.abspath(shader_dir) for shader_dir in shader_dirs]
+        self.size = (int(size[0]), int(size[1]))
+        self.args_for_shaders = args_for_shaders
+        self.out_dir = out_dir
+        self.processes = processes or os.cpu_count() or 1
+        # Frames submitted but not collected, bounds the memory held by queued inputs and results
+        self.max_in_flight = max_in_flight or self.processes * 2
+        self.backend = backend
+        self.out_format = out_format
+        self.stats = {"frames": 0, "seconds": 0.0, "fps": 0.0}
+
+    @staticmethod
+    def load_frame(source) -> pygame.Surface:
+        # A path, a Surface, or a (height, width, 3 | 4) uint8 array
+        if isinstance(source, pygame.Surface):
+            return source
+        if isinstance(source, str):
+            return pygame.image.load(source)
+        height, width = source.shape[:2]
+        fmt = "RGBA" if len(source.shape) == 3 and source.shape[2] == 4 else "RGB"
+        return pygame.image.frombuffer(source.tobytes(), (width, height), fmt)
+
+    def run(self, frames):
+        # frames yields sources or (source, args_for_shaders) pairs, results come back in the same order:
+        # (index, output path) with an out_dir, (index, RGBA bytes) without one
+        if self.out_dir is not None:
+            os.makedirs(self.out_dir, exist_ok=True)
+        init_args = (self.shader_dirs, self.size, self.args_for_shaders, self.backend, self.out_dir, self.out_format)
+        # spawn gives every worker a fresh process to create its own GL context in
+        mp = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        count = 0
+        with mp.Pool(self.processes, initializer=_init_worker, initargs=init_args) as pool:
+            in_flight = deque()
+            for index, frame in enumerate(frames):
+                source, args_for_shaders = frame if isinstance(frame, tuple) else (frame, None)
+                in_flight.append(pool.apply_async(_render_frame, ((index, source, args_for_shaders),)))
+                if len(in_flight) >= self.max_in_flight:
+                    yield in_flight.popleft().get()
+                    count += 1
+            while in_flight:
+                yield in_flight.popleft().get()
+                count += 1
+        seconds = time.perf_counter() - start
+        self.stats = {"frames": count, "seconds": seconds, "fps": count / seconds if seconds else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a shader chain over image files without a window")
+    parser.add_argument("inputs", nargs="+", help="image files to process")
+    parser.add_argument("--shaders", nargs="+", required=True, help="shader directories, in chain order")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--size", nargs=2, type=int, default=(1920, 1080))
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+    args = parser.parse_args()
+
+    renderer = BatchRenderer(args.shaders, args.size, out_dir=args.out, processes=args.processes, backend=args.backend)
+    for _ in renderer.run(args.inputs):
+        pass
+    stats = renderer.stats
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f}s ({stats['fps']:.1f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import moderngl
+import pygame
+
+from .RenderTargetPool import RenderTargetPool
+from .Shader import Shader
+from .ShaderChainer import ShaderChainer
+from .ShaderRegistry import ShaderRegistry
+from .SurfaceTextureCache import SurfaceTextureCache
+
+
+class Benchmark:
+
+    RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+    SHADER_METHODS = ("render", "render_texture", "render_frame_buffer")
+    # Drawn by SpriteBatch from per instance attributes, or passes of the Pyramid effects, not full screen effects
+    SKIPPED = {"sprite_batch_shader", "dual_filter_down_shader", "dual_filter_up_shader", "bloom_prefilter_shader",
+               "bloom_composite_shader"}
+
+    # Uniforms Main.py drives the bundled effects with, "time" advances every frame
+    DEFAULT_ARGS = {
+        "bg_pnois_shader": {"color": (90, 158, 81), "darkness_mult": 0.5},
+        "bg_noise_shader2": {"time": 0.0},
+        "crt_shader": {"u_rgb_shift": 0.01, "u_exposure": 0.5},
+        "pixalation_shader": {"pixelSize": 200},
+    }
+
+    # name -> (shader directories in chain order, ShaderChainer method)
+    CHAINS = {
+        "main_background": (["bg_pnois_shader", "bg_noise_shader2"], "render"),
+        "main_background+crt": (["bg_pnois_shader", "bg_noise_shader2", "crt_shader"], "render"),
+        "pixelation+default": (["pixalation_shader", "default_pipline_render_shader"], "render_framebuffer"),
+        "crt+pixelation": (["crt_shader", "pixalation_shader"], "render_framebuffer"),
+    }
+
+    def __init__(self, ctx: moderngl.Context = None, resolutions: dict = None, frames=60, warmup=5, backend: str = None):
+        # Without ctx a standalone context is created, backend="egl" runs it without a display
+        if ctx is None:
+            ctx = moderngl.create_standalone_context(**({"backend": backend} if backend else {}))
+        self.ctx = ctx
+        self.resolutions = resolutions or Benchmark.RESOLUTIONS
+        self.frames = frames
+        self.warmup = warmup
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.uploads = SurfaceTextureCache.for_context(ctx)
+
+    @staticmethod
+    def shader_dirs() -> list[str]:
+        return [ShaderRegistry.path(name) for name in ShaderRegistry.effects() if name not in Benchmark.SKIPPED]
+
+    @staticmethod
+    def args_for(shader_dir: str, frame: int) -> dict:
+        args = dict(Benchmark.DEFAULT_ARGS.get(os.path.basename(shader_dir), {}))
+        if "time" in args:
+            args["time"] = frame / 60
+        return args
+
+    @staticmethod
+    def input_surface(size) -> pygame.Surface:
+        # A gradient rather than a flat fill so effects that branch on color do real work
+        surf = pygame.Surface(size, pygame.SRCALPHA)
+        for x in range(0, size[0], 8):
+            surf.fill((x * 255 // size[0], 128, 255 - x * 255 // size[0], 255), (x, 0, 8, size[1]))
+        return surf
+
+    def measure(self, draw) -> dict:
+        # draw(frame) renders one frame, the context is finished before and after the timed frames
+        for frame in range(self.warmup):
+            draw(frame)
+        self.ctx.finish()
+        uploaded = self.uploads.bytes_uploaded
+        allocations = self.pool.misses + self.uploads.allocations
+        start = time.perf_counter()
+        for frame in range(self.frames):
+            draw(self.warmup + frame)
+        self.ctx.finish()
+        seconds = time.perf_counter() - start
+        return {
+            "fps": self.frames / seconds if seconds else 0.0,
+            "ms_per_frame": seconds * 1000 / self.frames,
+            "allocations_per_frame": (self.pool.misses + self.uploads.allocations - allocations) / self.frames,
+            "upload_bytes_per_frame": (self.uploads.bytes_uploaded - uploaded) / self.frames,
+        }
+
+    def run(self) -> dict:
+        results = {}
+        for label, size in self.resolutions.items():
+            surf = Benchmark.input_surface(size)
+            texture = self.ctx.texture(size, 4)
+            fbo = self.ctx.framebuffer(color_attachments=[self.ctx.texture(size, 4)])
+            texture.write(pygame.image.tobytes(surf, "RGBA"))
+
+            for shader_dir in Benchmark.shader_dirs():
+                name = os.path.basename(shader_dir)
+                try:
+                    shader = Shader(shader_dir, self.ctx, screen_size=size)
+                except Exception as e:
+                    results[f"shader/{name}@{label}"] = {"error": str(e)}
+                    continue
+                draws = {
+                    "render": lambda frame: shader.render(surf, (0, 0), fbo, **Benchmark.args_for(shader_dir, frame)),
+                    "render_texture": lambda frame: shader.render_texture(texture, fbo, **Benchmark.args_for(shader_dir, frame)),
+                    "render_frame_buffer": lambda frame: shader.render_frame_buffer(fbo, **Benchmark.args_for(shader_dir, frame)),
+                }
+                for method in Benchmark.SHADER_METHODS:
+                    results[f"shader/{name}/{method}@{label}"] = self.measure(draws[method])
+                if shader.sprite_quads is not None:
+                    shader.sprite_render_object.release()
+                    shader.sprite_quads.release()
+
+            for chain_name, (names, method) in Benchmark.CHAINS.items():
+                shader_dirs = [ShaderRegistry.path(name) for name in names]
+                chain = ShaderChainer([Shader(d, self.ctx, screen_size=size) for d in shader_dirs], self.ctx, size)
+                if method == "render":
+                    draw = lambda frame: chain.render(surf, (0, 0), fbo, [Benchmark.args_for(d, frame) for d in shader_dirs])
+                else:
+                    draw = lambda frame: chain.render_framebuffer(fbo, [Benchmark.args_for(d, frame) for d in shader_dirs])
+                results[f"chain/{chain_name}/{method}@{label}"] = self.measure(draw)
+                chain.release()
+
+            self.uploads.forget(surf)
+            texture.release()
+            fbo.color_attachments[0].release()
+            fbo.release()
+        return results
+
+    def report(self, results: dict) -> dict:
+        return {
+            "renderer": self.ctx.info.get("GL_RENDERER"),
+            "frames": self.frames,
+            "resolutions": {label: list(size) for label, size in self.resolutions.items()},
+            "results": results,
+        }
+
+    @staticmethod
+    def save(report: dict, path: str):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(path: str) -> dict:
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def compare(report: dict, baseline: dict, tolerance=0.15) -> list[str]:
+        # Returns one line per regression: fps down by more than tolerance, or more allocations / uploads per frame
+        regressions = []
+        if report.get("renderer") != baseline.get("renderer"):
+            regressions.append(f"renderer changed: {baseline.get('renderer')} -> {report.get('renderer')}, timings aren't comparable")
+        for key, old in baseline["results"].items():
+            new = report["results"].get(key)
+            if new is None or "error" in old:
+                continue
+            if "error" in new:
+                regressions.append(f"{key}: {new['error']}")
+                continue
+            if new["fps"] < old["fps"] * (1 - tolerance):
+                regressions.append(f"{key}: {old['fps']:.1f} -> {new['fps']:.1f} fps")
+            for counter in ("allocations_per_frame", "upload_bytes_per_frame"):
+                if new[counter] > old[counter]:
+                    regressions.append(f"{key}: {counter} {old[counter]:g} -> {new[counter]:g}")
+        return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every bundled shader and the common chains on a standalone context")
+    parser.add_argument("--out", default=None, help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", default=None, help="compare against an earlier JSON baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed fps drop against the baseline")
+    parser.add_argument("--resolutions", nargs="+", default=list(Benchmark.RESOLUTIONS), choices=list(Benchmark.RESOLUTIONS))
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+    args = parser.parse_args()
+
+    pygame.init()
+    resolutions = {label: Benchmark.RESOLUTIONS[label] for label in args.resolutions}
+    benchmark = Benchmark(resolutions=resolutions, frames=args.frames, backend=args.backend)
+    report = benchmark.report(benchmark.run())
+    for key, result in report["results"].items():
+        if "error" in result:
+            print(f"{key:60} error: {result['error'].splitlines()[0]}")
+            continue
+        print(f"{key:60} {result['fps']:9.1f} fps {result['allocations_per_frame']:6.2f} allocs "
+              f"{result['upload_bytes_per_frame'] / 1024:10.1f} KiB uploaded per frame")
+    if args.out:
+        Benchmark.save(report, args.out)
+    if args.baseline:
+        regressions = Benchmark.compare(report, Benchmark.load(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
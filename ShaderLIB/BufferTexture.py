@@ -0,0 +1,82 @@
+import moderngl
+import pygame
+
+from .SurfaceTextureCache import SurfaceTextureCache
+
+
+class BufferTexture:
+
+    # struct format of the buffer's items -> moderngl texture dtype
+    DTYPES = {"B": "f1", "e": "f2", "f": "f4"}
+    # 1 and 2 channel inputs read as grey and grey + alpha
+    SWIZZLES = {1: "RRR1", 2: "RRRG", 3: "RGB1", 4: "RGBA"}
+
+    def __init__(self, ctx: moderngl.Context):
+        # Texture streaming one buffer-protocol input (NumPy array, memoryview, bytes), recreated when its layout changes
+        self.ctx = ctx
+        self.texture = None
+        self.version = 0  # stamp of the last upload, drawn from the same sequence as surface uploads
+        self.uploads = SurfaceTextureCache.for_context(ctx)
+
+    @staticmethod
+    def is_buffer(data) -> bool:
+        if isinstance(data, (pygame.Surface, moderngl.Texture)):
+            return False
+        try:
+            memoryview(data)
+        except TypeError:
+            return False
+        return True
+
+    @staticmethod
+    def layout(data, size=None):
+        # Returns (memoryview, (width, height), components, dtype): shaped buffers are (height, width[, components]),
+        # flat ones (bytes) need size and hold 8 bit texels
+        view = memoryview(data)
+        dtype = BufferTexture.DTYPES.get(view.format.lstrip("@=<"))
+        if dtype is None:
+            raise ValueError(f"Buffers of '{view.format}' items can't be uploaded, use uint8, float16 or float32")
+        if view.ndim in (2, 3):
+            height, width = view.shape[:2]
+            components = view.shape[2] if view.ndim == 3 else 1
+        elif size is not None:
+            width, height = int(size[0]), int(size[1])
+            components = view.nbytes // (width * height * view.itemsize)
+            if components * width * height * view.itemsize != view.nbytes:
+                raise ValueError(f"{view.nbytes} bytes don't divide into {width}x{height} texels")
+        else:
+            raise ValueError("A flat buffer needs a size, or a (height, width, components) shape")
+        if components not in BufferTexture.SWIZZLES:
+            raise ValueError(f"Textures have 1 to 4 components, the buffer has {components}")
+        if not view.c_contiguous:
+            # Strided views (e.g. a sliced array) need one packing copy
+            view = memoryview(view.tobytes())
+        return view, (width, height), components, dtype
+
+    def upload(self, data, size=None, dirty_rect=None) -> moderngl.Texture:
+        # An empty dirty_rect keeps the texture as it is, any other re-uploads the whole buffer
+        if self.texture is not None and dirty_rect is not None:
+            rect = pygame.Rect(dirty_rect)
+            if rect.width == 0 or rect.height == 0:
+                return self.texture
+        view, size, components, dtype = BufferTexture.layout(data, size)
+        texture = self.texture
+        if texture is None or texture.size != size or texture.components != components or texture.dtype != dtype:
+            if texture is not None:
+                texture.release()
+            texture = self.texture = self.ctx.texture(size, components, dtype=dtype)
+            texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+            texture.repeat_x = False
+            texture.repeat_y = False
+            texture.swizzle = BufferTexture.SWIZZLES[components]
+            # Counted with the surface uploads so FrameProfiler and Benchmark see both
+            self.uploads.allocations += 1
+        texture.write(view)
+        self.version = SurfaceTextureCache.next_version()
+        self.uploads.bytes_uploaded += view.nbytes
+        return texture
+
+    def release(self):
+        if self.texture is not None:
+            self.texture.release()
+            self.texture = None
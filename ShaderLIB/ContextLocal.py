@@ -0,0 +1,43 @@
+from abc import ABC, abstractmethod
+
+import moderngl
+
+
+class ContextLocal(ABC):
+
+    # Attribute of the moderngl context holding its instances, class -> instance in creation order
+    ATTRIBUTE = "_shaderlib_locals"
+
+    # Base of the one-per-context pools and caches. Instances are kept on the context itself: a class level
+    # WeakKeyDictionary would keep the context alive through them, as they and the GL objects they hold
+    # reference it. Stored on it, they are collected together with the context
+    @classmethod
+    def for_context(cls, ctx: moderngl.Context):
+        instances = ContextLocal.instances(ctx)
+        instance = instances.get(cls)
+        if instance is None:
+            instance = cls(ctx)
+            instances[cls] = instance
+        return instance
+
+    @staticmethod
+    def instances(ctx: moderngl.Context) -> dict:
+        instances = getattr(ctx, ContextLocal.ATTRIBUTE, None)
+        if instances is None:
+            instances = {}
+            setattr(ctx, ContextLocal.ATTRIBUTE, instances)
+        return instances
+
+    @staticmethod
+    def release_context(ctx: moderngl.Context):
+        # Frees the GL objects every pool and cache of ctx holds and forgets them, call before ctx.release().
+        # Newest first, so caches return their targets to the pool before it's cleared
+        instances = ContextLocal.instances(ctx)
+        for instance in reversed(list(instances.values())):
+            instance.clear()
+        instances.clear()
+
+    @abstractmethod
+    def clear(self):
+        # Frees the GL objects the instance holds, called by release_context()
+        pass
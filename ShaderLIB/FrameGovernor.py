@@ -0,0 +1,130 @@
+from collections import deque
+
+from .FrameProfiler import FrameProfiler
+from .RenderGraph import ChainPass
+
+
+class FrameGovernor:
+
+    def __init__(self, chain, budget_ms=1000 / 60, min_scale=0.5, scale_step=0.75, max_refresh_every=4,
+                 headroom=0.75, window=10, cooldown=30, profiler: FrameProfiler = None):
+        # Keeps chain's GPU time under budget_ms: over it, ChainPass(scalable=True) passes render at a lower
+        # scale and ChainPass(slow=True) passes refresh every few frames. Quality comes back one step at a time
+        # once a window of frames fits in headroom * budget. cooldown frames separate two decisions
+        self.chain = chain
+        self.budget_ns = budget_ms * 1e6
+        self.min_scale = min_scale
+        self.scale_step = scale_step
+        self.max_refresh_every = max_refresh_every
+        self.headroom = headroom
+        self.window = window
+        self.cooldown = cooldown
+        self.profiler = profiler or FrameProfiler(chain.ctx, capacity=window * 4)
+        chain.set_profiler(self.profiler)
+
+        managed = [item for item in chain.shaders if isinstance(item, ChainPass)]
+        self.base_scales = {chain_pass: chain_pass.scale for chain_pass in managed if chain_pass.scalable}
+        self.refresh_every = {chain_pass: 1 for chain_pass in managed if chain_pass.slow}
+        self.costs = {}  # pass name -> smoothed GPU ns
+        self.frame_costs = deque(maxlen=window)
+        self.frame = 0
+        self.since_change = 0
+        self.seen = -1
+        self.log = deque(maxlen=100)  # (frame, decision) pairs, newest last
+
+    def begin_frame(self):
+        # Picks which held outputs this frame reuses, call before rendering the chain
+        self.profiler.begin_frame()
+        graph = self.chain.graph
+        holding, reuse = set(), None
+        for chain_pass, every in self.refresh_every.items():
+            if every <= 1 or not self.writes_target(chain_pass):
+                continue
+            position = self.position_of(chain_pass)
+            holding.add(position)
+            if self.frame % every and position in graph.held:
+                reuse = position if reuse is None else max(reuse, position)
+        graph.set_holding(holding)
+        graph.reuse = reuse
+
+    def end_frame(self):
+        self.profiler.end_frame()
+        self.frame += 1
+        self.since_change += 1
+        for frame_number, timings in self.profiler.frames:
+            if frame_number <= self.seen:
+                continue
+            self.seen = frame_number
+            self.frame_costs.append(sum(timing.gpu_ns for timing in timings))
+            for timing in timings:
+                cost = self.costs.get(timing.name)
+                self.costs[timing.name] = timing.gpu_ns if cost is None else cost * 0.8 + timing.gpu_ns * 0.2
+
+        if len(self.frame_costs) < self.window or self.since_change < self.cooldown:
+            return
+        average = sum(self.frame_costs) / len(self.frame_costs)
+        if average > self.budget_ns:
+            changed = self.degrade()
+        elif average < self.budget_ns * self.headroom:
+            changed = self.restore()
+        else:
+            return
+        if changed:
+            self.log.append((self.frame, f"{changed} ({average / 1e6:.2f} ms against {self.budget_ns / 1e6:.2f} ms)"))
+            self.since_change = 0
+            self.frame_costs.clear()
+
+    def degrade(self):
+        # Lowers the scale of the most expensive scalable pass first, then refreshes the most expensive slow pass less often
+        for chain_pass in sorted(self.base_scales, key=self.cost_of, reverse=True):
+            floor = self.base_scales[chain_pass] * self.min_scale
+            if chain_pass.scale > floor and self.writes_target(chain_pass):
+                chain_pass.scale = max(floor, chain_pass.scale * self.scale_step)
+                self.chain.compile()
+                return f"{chain_pass.shader.name} scale -> {chain_pass.scale:.2f}"
+        for chain_pass in sorted(self.refresh_every, key=self.cost_of, reverse=True):
+            if self.refresh_every[chain_pass] < self.max_refresh_every and self.writes_target(chain_pass):
+                self.refresh_every[chain_pass] += 1
+                return f"{chain_pass.shader.name} refresh every {self.refresh_every[chain_pass]} frames"
+        return None
+
+    def restore(self):
+        # Undoes degrade() in reverse: update rate first, then resolution
+        for chain_pass in sorted(self.refresh_every, key=self.refresh_every.get, reverse=True):
+            if self.refresh_every[chain_pass] > 1:
+                self.refresh_every[chain_pass] -= 1
+                return f"{chain_pass.shader.name} refresh every {self.refresh_every[chain_pass]} frames"
+        for chain_pass in sorted(self.base_scales, key=self.cost_of):
+            if chain_pass.scale < self.base_scales[chain_pass]:
+                chain_pass.scale = min(self.base_scales[chain_pass], chain_pass.scale / self.scale_step)
+                self.chain.compile()
+                return f"{chain_pass.shader.name} scale -> {chain_pass.scale:.2f}"
+        return None
+
+    def cost_of(self, chain_pass: ChainPass) -> float:
+        return self.costs.get(chain_pass.shader.name, 0.0)
+
+    def position_of(self, chain_pass: ChainPass):
+        # Position in the compiled graph of the pass drawing chain_pass, None if it was dropped
+        index = next(i for i, item in enumerate(self.chain.shaders) if item is chain_pass)
+        for position, render_pass in enumerate(self.chain.graph.passes):
+            if index in render_pass.indices:
+                return position
+        return None
+
+    def writes_target(self, chain_pass: ChainPass) -> bool:
+        # The last pass draws straight into the caller's framebuffer, neither lever applies to it
+        position = self.position_of(chain_pass)
+        return position is not None and self.chain.graph.passes[position].target is not None
+
+    def decisions(self) -> dict:
+        # Current state per managed pass, for logging
+        decisions = {}
+        for chain_pass in list(self.base_scales) + list(self.refresh_every):
+            decisions[chain_pass.shader.name] = {
+                "scale": chain_pass.scale,
+                "base_scale": self.base_scales.get(chain_pass, chain_pass.scale),
+                "refresh_every": self.refresh_every.get(chain_pass, 1),
+                "gpu_ms": self.cost_of(chain_pass) / 1e6,
+            }
+        return decisions
@@ -0,0 +1,143 @@
+import csv
+import json
+import time
+from collections import deque
+
+import moderngl
+
+from .RenderTargetPool import RenderTargetPool
+from .SurfaceTextureCache import SurfaceTextureCache
+
+
+class PassTiming:
+
+    FIELDS = ("frame", "name", "width", "height", "gpu_ns", "cpu_ns", "primitives", "bytes_uploaded", "allocations")
+
+    def __init__(self, name: str, resolution, query: moderngl.Query, cpu_ns: int, bytes_uploaded: int, allocations: int):
+        self.name = name
+        self.resolution = (int(resolution[0]), int(resolution[1]))
+        self.query = query  # in flight until the frame is resolved
+        self.gpu_ns = None
+        self.primitives = None
+        self.cpu_ns = cpu_ns
+        self.bytes_uploaded = bytes_uploaded
+        self.allocations = allocations
+
+    def as_dict(self, frame: int) -> dict:
+        return {
+            "frame": frame, "name": self.name, "width": self.resolution[0], "height": self.resolution[1],
+            "gpu_ns": self.gpu_ns, "cpu_ns": self.cpu_ns, "primitives": self.primitives,
+            "bytes_uploaded": self.bytes_uploaded, "allocations": self.allocations,
+        }
+
+
+class FrameProfiler:
+
+    def __init__(self, ctx: moderngl.Context, capacity=300, latency=3):
+        # Opt in per shader with Shader.profiler or ShaderChainer.set_profiler, unset it costs one attribute check a pass.
+        # GPU results are read latency frames after submission so reading a query doesn't stall the pipeline
+        self.ctx = ctx
+        self.latency = latency
+        self.frames = deque(maxlen=capacity)  # (frame number, [PassTiming]) with resolved GPU times
+        self.in_flight = deque()
+        self.current = None
+        self.frame_number = 0
+        self.free_queries = []
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.uploads = SurfaceTextureCache.for_context(ctx)
+
+    def begin_frame(self):
+        if self.current is not None:
+            self.end_frame()
+        self.current = []
+
+    def end_frame(self):
+        if self.current is None:
+            return
+        self.in_flight.append((self.frame_number, self.current))
+        self.current = None
+        self.frame_number += 1
+        while len(self.in_flight) > self.latency:
+            self.resolve(*self.in_flight.popleft())
+
+    def begin_pass(self, name: str, resolution):
+        # Returns the token for end_pass, GL timer queries can't nest so passes mustn't either
+        query = self.free_queries.pop() if self.free_queries else self.ctx.query(time=True, primitives=True)
+        token = (name, resolution, query, self.uploads.bytes_uploaded, self.allocation_count(), time.perf_counter_ns())
+        query.__enter__()
+        return token
+
+    def end_pass(self, token):
+        name, resolution, query, uploaded, allocations, start = token
+        query.__exit__(None, None, None)
+        cpu_ns = time.perf_counter_ns() - start
+        if self.current is None:
+            # Passes rendered outside begin_frame / end_frame still get a frame of their own
+            self.current = []
+        self.current.append(PassTiming(
+            name, resolution, query, cpu_ns,
+            self.uploads.bytes_uploaded - uploaded, self.allocation_count() - allocations,
+        ))
+
+    def allocation_count(self) -> int:
+        return self.pool.misses + self.uploads.allocations
+
+    def resolve(self, frame_number: int, timings: list[PassTiming]):
+        for timing in timings:
+            timing.gpu_ns = timing.query.elapsed
+            timing.primitives = timing.query.primitives
+            self.free_queries.append(timing.query)
+            timing.query = None
+        self.frames.append((frame_number, timings))
+
+    def flush(self):
+        # Resolves everything submitted, waiting for the GPU
+        self.end_frame()
+        while self.in_flight:
+            self.resolve(*self.in_flight.popleft())
+
+    def records(self) -> list[dict]:
+        return [timing.as_dict(frame) for frame, timings in self.frames for timing in timings]
+
+    def summary(self) -> dict:
+        # name -> {"count", "resolution", "gpu_ns"/"cpu_ns": {"p50", "p95", "max"}, "bytes_uploaded", "allocations"} per frame
+        grouped = {}
+        for frame, timings in self.frames:
+            for timing in timings:
+                grouped.setdefault(timing.name, []).append(timing)
+        summary = {}
+        for name, timings in grouped.items():
+            summary[name] = {
+                "count": len(timings),
+                "resolution": timings[-1].resolution,
+                "gpu_ns": FrameProfiler.percentiles([t.gpu_ns for t in timings]),
+                "cpu_ns": FrameProfiler.percentiles([t.cpu_ns for t in timings]),
+                "bytes_uploaded": sum(t.bytes_uploaded for t in timings) / len(timings),
+                "allocations": sum(t.allocations for t in timings) / len(timings),
+            }
+        return summary
+
+    @staticmethod
+    def percentiles(values: list[int]) -> dict:
+        values = sorted(values)
+        last = len(values) - 1
+        return {"p50": values[round(last * 0.5)], "p95": values[round(last * 0.95)], "max": values[last]}
+
+    def to_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"summary": self.summary(), "records": self.records()}, f, indent=2)
+
+    def to_csv(self, path: str):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=PassTiming.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records())
+
+    def clear(self):
+        self.flush()
+        self.frames.clear()
+
+    def release(self):
+        # moderngl has no release() for queries, the pooled ones are only dropped
+        self.flush()
+        self.free_queries = []
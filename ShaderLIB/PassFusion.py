@@ -0,0 +1,138 @@
+import os
+import re
+
+import moderngl
+
+from .Shader import Shader
+
+
+class PassFusion:
+
+    INPUT_SAMPLE = re.compile(r"texture\s*\(\s*tex\s*,\s*uvs\s*\)")
+    MAIN = re.compile(r"void\s+main\s*\(\s*(void)?\s*\)\s*\{")
+    UNIFORM = re.compile(r"^uniform\s+(\w+)\s+(.+)$", re.DOTALL)
+    OUTPUT = re.compile(r"^(layout\s*\([^)]*\)\s*)?out\s+vec4\s+(\w+)$")
+    INPUT = re.compile(r"^in\s+vec2\s+uvs$")
+
+    @staticmethod
+    def strip_comments(source: str) -> str:
+        source = re.sub(r"/\*.*?\*/", "", source, flags=re.DOTALL)
+        return re.sub(r"//[^\n]*", "", source)
+
+    @staticmethod
+    def split(fragment_shader: str, name: str):
+        # Returns (version, [(type, declarator)], output name, main body) of a point-wise fragment shader
+        source = PassFusion.strip_comments(fragment_shader)
+        version = re.search(r"#version\s+(\d+)", source)
+        version = int(version.group(1)) if version else 330
+        source = re.sub(r"#[^\n]*", "", source)
+
+        main = PassFusion.MAIN.search(source)
+        if main is None:
+            raise ValueError(f"{name} has no main()")
+        depth, end = 1, main.end()
+        while depth:
+            if end >= len(source):
+                raise ValueError(f"Unbalanced braces in main() of {name}")
+            depth += {"{": 1, "}": -1}.get(source[end], 0)
+            end += 1
+        body = source[main.end():end - 1]
+        outside = source[:main.start()] + source[end:]
+        if "{" in outside:
+            raise ValueError(f"{name} declares functions or blocks next to main(), it can't be fused")
+
+        uniforms, output = [], None
+        for statement in (s.strip() for s in outside.split(";")):
+            statement = re.sub(r"\s+", " ", statement)
+            if not statement or statement.startswith("precision "):
+                continue
+            uniform = PassFusion.UNIFORM.match(statement)
+            out = PassFusion.OUTPUT.match(statement)
+            if uniform:
+                for declarator in uniform.group(2).split(","):
+                    uniforms.append((uniform.group(1), declarator.strip()))
+            elif out:
+                output = out.group(2)
+            elif not PassFusion.INPUT.match(statement):
+                raise ValueError(f"{name} declares '{statement}', only uniforms, uvs and one vec4 output can be fused")
+        if output is None:
+            raise ValueError(f"{name} has no vec4 output")
+        if re.search(r"\breturn\b", body):
+            raise ValueError(f"{name} returns early from main(), it can't be fused")
+        return version, uniforms, output, body
+
+    @staticmethod
+    def fuse(shaders: list[Shader]):
+        # Returns the combined fragment source and, per pass, its uniform name -> namespaced name
+        versions, declarations, functions, calls, renames = [], [], [], [], []
+        for n, shader in enumerate(shaders):
+            prefix = f"p{n}_"
+            version, uniforms, output, body = PassFusion.split(shader.fragment_shader, shader.dir_loc)
+            versions.append(version)
+            body = PassFusion.INPUT_SAMPLE.sub(f"{prefix}in", body)
+            if re.search(r"\btex\b", body):
+                raise ValueError(f"{shader.dir_loc} samples tex away from uvs, it isn't point-wise")
+
+            names = {}
+            for glsl_type, declarator in uniforms:
+                name = re.match(r"\w+", declarator).group(0)
+                if name == "tex":
+                    continue
+                names[name] = prefix + name
+                declarations.append(f"uniform {glsl_type} {prefix}{declarator};")
+            # Swizzles and members (c.r next to a uniform r) follow a dot and keep their name
+            for name, renamed in names.items():
+                body = re.sub(rf"(?<![.\w]){name}\b", renamed, body)
+            renames.append(names)
+
+            functions.append(f"vec4 {prefix}main(vec4 {prefix}in) {{\n    vec4 {output};\n{body}\n    return {output};\n}}")
+            calls.append(f"    color = {prefix}main(color);")
+
+        source = "\n".join([
+            f"#version {max(versions)} core",
+            "",
+            "in vec2 uvs;",
+            "uniform sampler2D tex;",
+            *declarations,
+            "",
+            "out vec4 fusedColor;",
+            "",
+            *functions,
+            "",
+            "void main() {",
+            "    vec4 color = texture(tex, uvs);",
+            *calls,
+            "    fusedColor = color;",
+            "}",
+        ])
+        return source, renames
+
+    @staticmethod
+    def can_fuse(shader: Shader) -> bool:
+        # Members draw full screen quads through the default vertex shader, the fused program does too
+        return shader.transform == Shader.IDENTITY_TRANSFORM and shader.has_default_vertex_shader()
+
+
+class FusedShader(Shader):
+
+    def __init__(self, shaders: list[Shader], ctx: moderngl.Context, screen_size=(1920, 1080)):
+        self.members = shaders
+        fragment_shader, self.renames = PassFusion.fuse(shaders)
+        name = "+".join(os.path.basename(os.path.normpath(shader.dir_loc)) for shader in shaders)
+        # No vertex source: the generated name has no directory, so the default vertex shader is used
+        super().__init__(name, ctx, screen_size, fragment_shader=fragment_shader)
+        # Textures kept on the members follow them under their namespaced sampler names
+        for n, shader in enumerate(shaders):
+            for sampler, (texture, _) in shader.textures.items():
+                self.textures[self.renames[n][sampler]] = (texture, False)
+
+    def merge_args(self, args_list: list[dict]) -> dict:
+        # One kwargs dict per member, in chain order, mapped to the namespaced uniforms
+        merged = {}
+        for n, kwargs in enumerate(args_list):
+            for k, v in kwargs.items():
+                if k.startswith(Shader.SAMPLE2D_PREFIX):
+                    merged[Shader.SAMPLE2D_PREFIX + self.renames[n][k[len(Shader.SAMPLE2D_PREFIX):]]] = v
+                    continue
+                merged[self.renames[n][k]] = v
+        return merged
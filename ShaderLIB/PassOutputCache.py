@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+import moderngl
+
+from .ContextLocal import ContextLocal
+from .RenderTargetPool import RenderTargetPool, RenderTarget
+
+
+class PassOutputCache(ContextLocal):
+
+    def __init__(self, ctx: moderngl.Context, max_bytes: int = 128 * 1024 * 1024):
+        # Retained pass outputs keyed by what produced them (see RenderGraph.prefix_keys), oldest evicted past max_bytes
+        self.ctx = ctx
+        self.max_bytes = max_bytes
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.entries = OrderedDict()  # key -> RenderTarget, least recently used first
+        self.bytes_retained = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key) -> RenderTarget | None:
+        target = self.entries.get(key)
+        if target is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return target
+
+    def store(self, key, source: RenderTarget) -> RenderTarget | None:
+        # Copies source into a target of its own, None when it can't fit under max_bytes
+        if key in self.entries:
+            return self.entries[key]
+        if source.nbytes > self.max_bytes:
+            return None
+        while self.entries and self.bytes_retained + source.nbytes > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+            self.evictions += 1
+        target = self.pool.lease(*source.key)
+        self.ctx.copy_framebuffer(target.fbo, source.fbo)
+        self.entries[key] = target
+        self.bytes_retained += target.nbytes
+        return target
+
+    def invalidate(self, keys=None):
+        # Drops the given keys, or every retained output. Needed after changing a texture's contents in place
+        for key in list(self.entries) if keys is None else keys:
+            if key in self.entries:
+                self._evict(key)
+
+    def clear(self):
+        self.invalidate()
+
+    def _evict(self, key):
+        target = self.entries.pop(key)
+        self.bytes_retained -= target.nbytes
+        self.pool.release(target)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes_retained": self.bytes_retained,
+        }
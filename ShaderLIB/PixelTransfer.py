@@ -0,0 +1,89 @@
+from collections import deque
+
+import moderngl
+
+from .RenderTargetPool import RenderTargetPool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PixelTransfer:
+
+    def __init__(self, ctx: moderngl.Context, size, components=4, dtype="f1", ring_size=3):
+        self.ctx = ctx
+        self.size = (int(size[0]), int(size[1]))
+        self.components = components
+        self.dtype = dtype
+        self.ring_size = ring_size
+        self.nbytes = self.size[0] * self.size[1] * components * RenderTargetPool.DTYPE_SIZES[dtype]
+        # Pixel buffer objects the GPU consumes or fills while the CPU works on other frames
+        self.upload_buffers = [ctx.buffer(reserve=self.nbytes) for _ in range(ring_size)]
+        self.read_buffers = [ctx.buffer(reserve=self.nbytes) for _ in range(ring_size)]
+        # Host memory fetched readbacks land in, reused ring_size fetches later
+        self.host_frames = [bytearray(self.nbytes) for _ in range(ring_size)]
+        self.upload_index = 0
+        self.read_index = 0
+        self.fetch_index = 0
+        self.pending = deque()  # (slot, tag) of readbacks in flight, oldest first
+        self.bytes_uploaded = 0
+        self.bytes_read = 0
+
+    def upload(self, data, texture: moderngl.Texture, viewport=None):
+        # data is any buffer-protocol object laid out like the texture (or the viewport of it)
+        buffer = self.upload_buffers[self.upload_index]
+        self.upload_index = (self.upload_index + 1) % self.ring_size
+        data = memoryview(data).cast("B")
+        if data.nbytes > self.nbytes:
+            raise ValueError(f"Upload of {data.nbytes} bytes doesn't fit in a {self.nbytes} byte pixel buffer")
+        buffer.write(data)
+        texture.write(buffer, viewport=viewport)
+        self.bytes_uploaded += data.nbytes
+
+    def request_read(self, fbo: moderngl.Framebuffer, tag=None, attachment=0):
+        # Starts an asynchronous readback, fetch() hands it back once ring_size - 1 readbacks are in flight
+        if len(self.pending) == self.ring_size:
+            raise RuntimeError("Every pixel buffer has a readback in flight, fetch() one first")
+        slot = self.read_index
+        self.read_index = (self.read_index + 1) % self.ring_size
+        fbo.read_into(self.read_buffers[slot], viewport=(0, 0, *self.size), components=self.components,
+                      attachment=attachment, dtype=self.dtype)
+        self.pending.append((slot, tag))
+
+    def ready(self) -> bool:
+        # True once ring_size - 1 readbacks are in flight, so the oldest had frames of slack to complete
+        return len(self.pending) >= self.ring_size - 1 and len(self.pending) > 0
+
+    def fetch(self, wait=False):
+        # Returns (tag, memoryview) of the oldest readback, or None when it's too early and wait is False.
+        # The memoryview is valid until ring_size more readbacks have been fetched
+        if not self.pending or (not wait and not self.ready()):
+            return None
+        slot, tag = self.pending.popleft()
+        host = self.host_frames[self.fetch_index]
+        self.fetch_index = (self.fetch_index + 1) % self.ring_size
+        self.read_buffers[slot].read_into(host)
+        self.bytes_read += self.nbytes
+        return tag, memoryview(host)
+
+    def flush(self):
+        # Yields every readback still in flight, oldest first
+        while self.pending:
+            yield self.fetch(wait=True)
+
+    def as_array(self, view: memoryview):
+        # NumPy view (height, width, components) over a fetched frame, rows bottom to top like OpenGL
+        if numpy is None:
+            raise ModuleNotFoundError("numpy is required for PixelTransfer.as_array")
+        dtypes = {"f1": numpy.uint8, "f2": numpy.float16, "f4": numpy.float32, "u1": numpy.uint8,
+                  "u2": numpy.uint16, "u4": numpy.uint32, "i1": numpy.int8, "i2": numpy.int16, "i4": numpy.int32}
+        return numpy.frombuffer(view, dtype=dtypes[self.dtype]).reshape(self.size[1], self.size[0], self.components)
+
+    def release(self):
+        for buffer in self.upload_buffers + self.read_buffers:
+            buffer.release()
+        self.upload_buffers = []
+        self.read_buffers = []
+        self.pending.clear()
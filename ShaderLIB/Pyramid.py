@@ -0,0 +1,124 @@
+import moderngl
+
+from .RenderTargetPool import RenderTargetPool
+from .Shader import Shader
+from .ShaderRegistry import ShaderRegistry
+
+
+class Pyramid:
+
+    def __init__(self, ctx: moderngl.Context, size, levels=5, dtype="f1"):
+        # Progressively half sized targets from the context's pool, level n is size / 2 ** (n + 1).
+        # After downsample() the levels hold the shrunk image, after upsample() the blurred one; either
+        # way level.texture can be bound to another pass (e.g. as a sample2D_ argument)
+        self.ctx = ctx
+        self.size = (int(size[0]), int(size[1]))
+        self.dtype = dtype
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.levels = []
+        width, height = self.size
+        for _ in range(levels):
+            if width == 1 and height == 1:
+                break
+            width, height = max(1, width // 2), max(1, height // 2)
+            level = self.pool.lease((width, height), 4, dtype, (moderngl.LINEAR, moderngl.LINEAR))
+            # Clamped, the wide taps of the small levels would otherwise wrap to the opposite edge
+            level.texture.repeat_x = False
+            level.texture.repeat_y = False
+            self.levels.append(level)
+        screen_size = self.size
+        self.down = Shader(ShaderRegistry.path("dual_filter_down_shader"), ctx, screen_size)
+        self.up = Shader(ShaderRegistry.path("dual_filter_up_shader"), ctx, screen_size)
+
+    @staticmethod
+    def halfpixel(texture: moderngl.Texture) -> tuple:
+        return 0.5 / texture.width, 0.5 / texture.height
+
+    def downsample(self, source: moderngl.Texture, offset=1.0, first: Shader = None, **first_args) -> moderngl.Texture:
+        # first (with first_args, plus u_halfpixel) draws level 0 instead of the plain downsample, e.g. a threshold
+        tex = source
+        for n, level in enumerate(self.levels):
+            # Cleared so a blending context doesn't mix in the previous frame
+            level.fbo.clear()
+            if n == 0 and first is not None:
+                first.render_texture(tex, level.fbo, flip_y=True, u_halfpixel=Pyramid.halfpixel(tex), **first_args)
+            else:
+                self.down.render_texture(tex, level.fbo, flip_y=True, u_halfpixel=Pyramid.halfpixel(tex), u_offset=offset)
+            tex = level.texture
+        return tex
+
+    def upsample(self, offset=1.0) -> moderngl.Texture:
+        # Walks back up, each level replaced by the upsampled level below it. Returns level 0
+        for n in range(len(self.levels) - 2, -1, -1):
+            source = self.levels[n + 1].texture
+            self.levels[n].fbo.clear()
+            self.up.render_texture(source, self.levels[n].fbo, flip_y=True, u_halfpixel=Pyramid.halfpixel(source), u_offset=offset)
+        return self.levels[0].texture
+
+    def release(self):
+        for level in self.levels:
+            # Back to the pool's default wrap mode, which its keys don't tell apart
+            level.texture.repeat_x = True
+            level.texture.repeat_y = True
+            self.pool.release(level)
+        self.levels = []
+
+
+class DualFilterBlur:
+
+    def __init__(self, ctx: moderngl.Context, screen_size=(1920, 1080), levels=4, offset=1.0, dtype="f1"):
+        # The radius grows with levels (doubling each) and offset, the cost stays close to 1.3 full screen
+        # passes whatever the radius since every level has a quarter of the pixels of the one above
+        self.ctx = ctx
+        self.screen_size = screen_size
+        self.offset = offset
+        self.pyramid = Pyramid(ctx, screen_size, levels, dtype)
+
+    def render_texture(self, tex: moderngl.Texture, fbo: moderngl.Framebuffer = None, flip_y=False):
+        self.pyramid.downsample(tex, self.offset)
+        blurred = self.pyramid.upsample(self.offset)
+        self.pyramid.up.render_texture(blurred, fbo, flip_y=flip_y, u_halfpixel=Pyramid.halfpixel(blurred), u_offset=self.offset)
+
+    def render_frame_buffer(self, fbo: moderngl.Framebuffer = None, flip_y=False):
+        # The last pass only samples the pyramid, so fbo can be its own input
+        if fbo is None:
+            fbo = self.ctx.screen
+        self.render_texture(fbo.color_attachments[0], fbo, flip_y)
+
+    def release(self):
+        self.pyramid.release()
+
+
+class Bloom:
+
+    def __init__(self, ctx: moderngl.Context, screen_size=(1920, 1080), levels=5, threshold=0.8, knee=0.5,
+                 intensity=1.0, offset=1.0, dtype="f2"):
+        # Half float levels by default so bright HDR input isn't clipped before it spreads
+        self.ctx = ctx
+        self.screen_size = screen_size
+        self.threshold = threshold
+        self.knee = knee
+        self.intensity = intensity
+        self.offset = offset
+        self.pyramid = Pyramid(ctx, screen_size, levels, dtype)
+        self.prefilter = Shader(ShaderRegistry.path("bloom_prefilter_shader"), ctx, screen_size)
+        self.composite = Shader(ShaderRegistry.path("bloom_composite_shader"), ctx, screen_size)
+
+    def render_texture(self, tex: moderngl.Texture, fbo: moderngl.Framebuffer = None, flip_y=False):
+        self.pyramid.downsample(tex, self.offset, self.prefilter, u_threshold=self.threshold, u_knee=self.knee)
+        glow = self.pyramid.upsample(self.offset)
+        self.composite.render_texture(tex, fbo, flip_y=flip_y, sample2D_bloom=glow, u_intensity=self.intensity)
+
+    def render_frame_buffer(self, fbo: moderngl.Framebuffer = None, flip_y=False):
+        # The composite samples the scene, which is copied aside first so fbo isn't read while written
+        if fbo is None:
+            fbo = self.ctx.screen
+        pool = self.pyramid.pool
+        scene = fbo.color_attachments[0]
+        target = pool.lease(scene.size, scene.components, scene.dtype)
+        self.ctx.copy_framebuffer(target.fbo, fbo)
+        self.render_texture(target.texture, fbo, flip_y)
+        pool.release(target)
+
+    def release(self):
+        self.pyramid.release()
@@ -0,0 +1,374 @@
+import moderngl
+
+from .BufferTexture import BufferTexture
+from .PassFusion import PassFusion, FusedShader
+from .PassOutputCache import PassOutputCache
+from .RenderTargetPool import RenderTargetPool
+from .Shader import Shader
+
+
+class ChainPass:
+
+    def __init__(self, shader, scale=1.0, size=None, filter=(moderngl.LINEAR, moderngl.LINEAR), pointwise=False, dtype="f1",
+                 scalable=False, slow=False, components=4, reads=4):
+        self.shader = shader
+        self.scale = scale  # output size relative to the chain's screen size
+        self.size = size  # absolute output size, overrides scale
+        self.filter = filter  # how the next pass samples (and upsamples) the output
+        self.pointwise = pointwise  # only samples tex at uvs, may be fused with its point-wise neighbours
+        self.dtype = dtype  # texel type of the output, "f2" / "f4" keep HDR values above 1.0
+        # Channels of fragColor worth keeping (1 for a luminance or mask in .r, 2 for .rg, 3 for opaque RGB) and
+        # channels of tex the pass reads (1 for .r only, 2 for .rg, 3 for .rgb). Targets keep the fewer of the two
+        self.components = components
+        self.reads = reads
+        # Hints for a FrameGovernor: the output may be rendered at a lower scale, or refreshed every few frames
+        self.scalable = scalable
+        self.slow = slow
+
+    @staticmethod
+    def wrap(item) -> "ChainPass":
+        return item if isinstance(item, ChainPass) else ChainPass(item)
+
+    def output_size(self, screen_size) -> tuple[int, int]:
+        if self.size is not None:
+            return int(self.size[0]), int(self.size[1])
+        return max(1, round(screen_size[0] * self.scale)), max(1, round(screen_size[1] * self.scale))
+
+
+class RenderPass:
+
+    def __init__(self, indices: list[int], shader, renderer: moderngl.VertexArray, target):
+        # Positions of the chain's shaders drawn by this pass (several once fused), pick their args_for_shaders
+        self.indices = indices
+        self.index = indices[0]
+        self.shader = shader
+        self.renderer = renderer
+        self.target = target  # RenderTarget written by the pass, None for the caller's framebuffer
+        self.uniform_slots = shader.uniforms
+        # Uniform blocks change behind the pass' back (e.g. FrameGlobals time), their output is never retained
+        self.memoizable = not any(isinstance(shader.program[name], moderngl.UniformBlock) for name in shader.program)
+
+
+class RenderGraph:
+
+    NO_ARGS = {}
+    NO_UPLOAD = (0, 0, 0, 0)
+    SAMPLER_2D = 0x8B5E
+    SAMPLED_DTYPES = {"f1", "f2", "f4"}
+    COMPONENTS = (1, 2, 3, 4)
+    TEXTURE_TYPES = (moderngl.Texture, moderngl.TextureArray, moderngl.Texture3D, moderngl.TextureCube)
+
+    def __init__(self, shaders: list, ctx: moderngl.Context, screen_size, drop_identity=False, fuse=False, memoize=False):
+        # shaders may mix Shader and ChainPass items. memoize=True keeps the output of the longest unchanged
+        # prefix of render() (same surface upload, uniforms and textures as the frame before) and starts from it
+        self.ctx = ctx
+        self.screen_size = screen_size
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.memoize = memoize
+        self.outputs = PassOutputCache.for_context(ctx)
+        self.last_keys = []
+        self.retained_key = None
+        # Outputs kept across frames for positions in holding, reuse starts the next render after one of them
+        self.holding = set()
+        self.held = {}  # pass position -> RenderTarget
+        self.reuse = None
+        chain = [ChainPass.wrap(item) for item in shaders]
+        RenderGraph.validate([chain_pass.shader for chain_pass in chain])
+        # Shader.generation of every pass, a reloaded shader makes the graph stale. The sources allow revert()
+        self.generations = [(chain_pass.shader, chain_pass.shader.generation) for chain_pass in chain]
+        self.sources = {chain_pass.shader: (chain_pass.shader.vertex_shader, chain_pass.shader.fragment_shader) for chain_pass in chain}
+
+        # Copies in the middle of the chain don't change the image, the first and last pass place it. Opt-in:
+        # with blending enabled each draw into a cleared target changes rgb and alpha, so copies aren't no-ops
+        last = len(chain) - 1
+        indices = []
+        for i, chain_pass in enumerate(chain):
+            if drop_identity and 0 < i < last and chain_pass.shader.is_identity() \
+                    and chain_pass.output_size(screen_size) == chain[indices[-1]].output_size(screen_size):
+                continue
+            indices.append(i)
+        self.dropped = [i for i in range(len(chain)) if i not in indices]
+
+        # Runs of point-wise passes become one generated program
+        groups = RenderGraph.fusion_groups(chain, indices, screen_size) if fuse else [[i] for i in indices]
+
+        # Every pass writes a target sized for it, reusing one the pass doesn't sample (A/B for equal sizes)
+        self.targets = []
+        self.passes = []
+        self.fused = []
+        previous = None
+        try:
+            for n, group in enumerate(groups):
+                target = None
+                if n < len(groups) - 1:
+                    components = RenderGraph.negotiate(chain[group[-1]], chain[groups[n + 1][0]])
+                    target = self.target_for(chain[group[-1]], previous, components)
+                shader = chain[group[0]].shader
+                if len(group) > 1:
+                    shader = FusedShader([chain[i].shader for i in group], ctx, screen_size)
+                    self.fused.append(shader)
+                self.passes.append(RenderPass(group, shader, shader.flipped_render_object, target))
+                previous = target
+        except Exception:
+            # A bad format or a fused program that doesn't compile, the targets leased so far go back
+            self.release()
+            raise
+
+    def stale(self) -> bool:
+        # True once a shader of the chain was reloaded, its passes hold the old program (and fused source)
+        return any(shader.generation != generation for shader, generation in self.generations)
+
+    def revert(self) -> list:
+        # Puts shaders reloaded since the graph was built back on its sources (their programs are still cached),
+        # the graph is current again. Returns the reverted shaders
+        reverted = []
+        for shader, generation in self.generations:
+            if shader.generation != generation and shader not in reverted:
+                shader.reload(*self.sources[shader])
+                reverted.append(shader)
+        self.generations = [(shader, shader.generation) for shader, _ in self.generations]
+        return reverted
+
+    @staticmethod
+    def fusion_groups(chain: list[ChainPass], indices: list[int], screen_size) -> list[list[int]]:
+        groups = []
+        for i in indices:
+            if groups and RenderGraph.fusible(chain[i]) and RenderGraph.fusible(chain[groups[-1][0]]) \
+                    and chain[groups[-1][0]].output_size(screen_size) == chain[i].output_size(screen_size):
+                groups[-1].append(i)
+                continue
+            groups.append([i])
+        return groups
+
+    @staticmethod
+    def fusible(chain_pass: ChainPass) -> bool:
+        return chain_pass.pointwise and PassFusion.can_fuse(chain_pass.shader)
+
+    @staticmethod
+    def negotiate(producer: ChainPass, consumer: ChainPass) -> int:
+        # Components of the target between two passes, 1 / 2 / 3 read back as grey / .rg / opaque RGB
+        for chain_pass, count in ((producer, producer.components), (consumer, consumer.reads)):
+            if count not in RenderGraph.COMPONENTS:
+                raise ValueError(f"{chain_pass.shader.dir_loc} declares {count} components, use one of {RenderGraph.COMPONENTS}")
+        return min(producer.components, consumer.reads)
+
+    def target_for(self, chain_pass: ChainPass, sampled, components=4):
+        if chain_pass.dtype not in RenderGraph.SAMPLED_DTYPES:
+            raise ValueError(f"{chain_pass.shader.dir_loc} outputs {chain_pass.dtype}, the next pass samples it as float, use one of {sorted(RenderGraph.SAMPLED_DTYPES)}")
+        # Lifetimes in a chain end at the next pass, any target of the same format it doesn't sample is free
+        key = RenderTargetPool.make_key(chain_pass.output_size(self.screen_size), components, chain_pass.dtype, chain_pass.filter)
+        for target in self.targets:
+            if target.key == key and target is not sampled:
+                return target
+        target = self.pool.lease(*key)
+        self.targets.append(target)
+        return target
+
+    @staticmethod
+    def validate(shaders: list):
+        if not shaders:
+            raise ValueError("A chain needs at least one shader")
+        for i, shader in enumerate(shaders):
+            tex = shader.uniforms.get("tex")
+            if tex is None:
+                raise ValueError(f"Pass {i} ({shader.dir_loc}) doesn't sample tex, the output of the pass before it would be lost")
+            if tex.gl_type != RenderGraph.SAMPLER_2D:
+                raise ValueError(f"Pass {i} ({shader.dir_loc}) samples tex with a non float sampler, chain targets are sampler2D")
+
+    def render(self, surf, pos_rect, render_fbo=None, args_for_shaders: list[dict] = None, dirty_rect=None, bounded=False, margin=0):
+        # dirty_rect is passed on to Shader.render, an empty one tells memoized graphs surf didn't change.
+        # bounded=True shades only surf's destination rectangle (grown by margin) in every pass
+        args_for_shaders = args_for_shaders or ()
+        if render_fbo is None:
+            render_fbo = self.ctx.screen
+        region = Shader.destination_rect(surf, pos_rect) if bounded else None
+        resumed = self.resumed()
+        if resumed is not None:
+            self.execute(resumed.texture, self.reuse + 1, render_fbo, args_for_shaders, region=region, margin=margin)
+            return
+        first = self.passes[0]
+        if first.target is None:
+            first.shader.render(surf, pos_rect, render_fbo, dirty_rect, **self.args_for(first, args_for_shaders))
+            return
+        if not self.memoize:
+            self.clear_target(first.target, region, margin)
+            first.shader.render(surf, pos_rect, first.target.fbo, dirty_rect, **self.args_for(first, args_for_shaders))
+            self.keep_output(0, first.target)
+            self.execute(first.target.texture, 1, render_fbo, args_for_shaders, region=region, margin=margin)
+            return
+
+        # Upload first, the input's version stamp is part of the first pass' key
+        tex = first.shader.upload(surf, dirty_rect, pos_rect)
+        input_key = ("input", first.shader.input_version(surf), tex.size, (pos_rect[0], pos_rect[1]), region, margin)
+        keys = self.prefix_keys(input_key, args_for_shaders)
+        start, tex = 0, None
+        for n in range(len(keys) - 1, -1, -1):
+            retained = self.outputs.lookup(keys[n]) if keys[n] is not None else None
+            if retained is not None:
+                start, tex = n + 1, retained.texture
+                break
+        # Keys chain through the prefix, the deepest one equal to last frame's marks the output worth retaining
+        stable = max((n for n, key in enumerate(keys) if key is not None and n < len(self.last_keys) and key == self.last_keys[n]), default=-1)
+        self.last_keys = keys
+        retain = (stable, keys[stable]) if stable >= start else None
+
+        if start == 0:
+            self.clear_target(first.target, region, margin)
+            first.shader.render(surf, pos_rect, first.target.fbo, RenderGraph.NO_UPLOAD, **self.args_for(first, args_for_shaders))
+            self.keep_output(0, first.target, retain)
+            start, tex = 1, first.target.texture
+        self.execute(tex, start, render_fbo, args_for_shaders, retain, region, margin)
+
+    def render_framebuffer(self, render_fbo=None, args_for_shaders: list[dict] = None, region=None, margin=0):
+        # region=(x, y, width, height) in screen pixels from the top left limits every pass to it, grown by margin
+        args_for_shaders = args_for_shaders or ()
+        if render_fbo is None:
+            render_fbo = self.ctx.screen
+        if len(self.passes) == 1:
+            # A single pass would sample the target it writes, keep the copying path for it
+            only = self.passes[0]
+            only.shader.render_frame_buffer(render_fbo, flip_y=True, region=region, margin=margin, **self.args_for(only, args_for_shaders))
+            return
+        resumed = self.resumed()
+        if resumed is not None:
+            self.execute(resumed.texture, self.reuse + 1, render_fbo, args_for_shaders, region=region, margin=margin, replace=True)
+            return
+        self.execute(render_fbo.color_attachments[0], 0, render_fbo, args_for_shaders, region=region, margin=margin, replace=True)
+
+    def execute(self, tex: moderngl.Texture, start: int, render_fbo: moderngl.Framebuffer, args_for_shaders, retain=None, region=None,
+                margin=0, replace=False):
+        # retain=(pass position, key) copies that pass' output into the PassOutputCache.
+        # With a region every pass is scissored to it, the caller's framebuffer keeps the pixels outside.
+        # replace=True clears render_fbo (inside the region) before the last pass, so with blending enabled the
+        # output replaces the input like Shader.render_frame_buffer's copy does instead of blending over it
+        for n, render_pass in enumerate(self.passes[start:], start):
+            fbo = render_fbo if render_pass.target is None else render_pass.target.fbo
+            profiler = render_pass.shader.profiler
+            if profiler is not None:
+                token = profiler.begin_pass(render_pass.shader.name, fbo.size)
+            if render_pass.target is not None:
+                self.clear_target(render_pass.target, region, margin)
+            elif replace:
+                render_fbo.clear(viewport=Shader.scissor_box(region, margin, render_fbo.size, self.screen_size) if region is not None else None)
+            if region is not None:
+                fbo.scissor = Shader.scissor_box(region, margin, fbo.size, self.screen_size)
+            fbo.use()
+            render_pass.shader.draw(render_pass.renderer, tex, self.args_for(render_pass, args_for_shaders))
+            if region is not None:
+                fbo.scissor = None
+            if profiler is not None:
+                profiler.end_pass(token)
+            if render_pass.target is not None:
+                tex = render_pass.target.texture
+                self.keep_output(n, render_pass.target, retain)
+
+    def keep_output(self, n: int, target, retain=None):
+        if retain is not None and retain[0] == n:
+            self.retain_output(target, retain[1])
+        if n in self.holding:
+            self.hold_output(n, target)
+
+    def hold_output(self, n: int, target):
+        held = self.held.get(n)
+        if held is None or held.key != target.key:
+            if held is not None:
+                self.pool.release(held)
+            held = self.held[n] = self.pool.lease(*target.key)
+        self.ctx.copy_framebuffer(held.fbo, target.fbo)
+
+    def set_holding(self, positions):
+        # Pass positions whose output is copied aside after drawing, for a later render to resume from
+        self.holding = set(positions)
+        for n in [n for n in self.held if n not in self.holding]:
+            self.pool.release(self.held.pop(n))
+
+    def resumed(self):
+        # The held output reuse points at, None when the chain has to run from its input
+        if self.reuse is None:
+            return None
+        return self.held.get(self.reuse)
+
+    def clear_target(self, target, region, margin):
+        # Bounded passes sample up to margin beyond the box they shade, the cleared area covers that too
+        if region is None:
+            target.fbo.clear()
+            return
+        target.fbo.clear(viewport=Shader.scissor_box(region, 2 * margin, target.size, self.screen_size))
+
+    def prefix_keys(self, key, args_for_shaders) -> list:
+        # One key per pass writing a target, chained from the input's key. None from the first pass whose
+        # output can't be retained
+        keys = []
+        for render_pass in self.passes[:-1]:
+            if key is not None and render_pass.memoizable:
+                shader = render_pass.shader
+                key = (
+                    key, shader.program.glo, render_pass.target.key, shader.transform,
+                    tuple((name, texture.glo) for name, (texture, _) in shader.textures.items()),
+                    RenderGraph.freeze(self.args_for(render_pass, args_for_shaders)),
+                )
+            else:
+                key = None
+            keys.append(key)
+        return keys
+
+    @staticmethod
+    def freeze(value):
+        # Hashable stand-in for uniform values, textures count by identity (invalidate() after rewriting one)
+        if isinstance(value, dict):
+            # Buffers bound to samplers are uploaded on every draw, they never give the same key twice
+            return tuple(sorted(
+                (k, object() if k.startswith(Shader.SAMPLE2D_PREFIX) and BufferTexture.is_buffer(v) else RenderGraph.freeze(v))
+                for k, v in value.items()
+            ))
+        if isinstance(value, RenderGraph.TEXTURE_TYPES):
+            return "texture", value.glo
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        if isinstance(value, (list, tuple)):
+            return tuple(RenderGraph.freeze(v) for v in value)
+        return value
+
+    def retain_output(self, target, key):
+        # One retained output per graph, replacing the one kept for an older prefix
+        if self.retained_key is not None and self.retained_key != key:
+            self.outputs.invalidate([self.retained_key])
+        self.retained_key = key if self.outputs.store(key, target) is not None else None
+
+    def invalidate(self):
+        # Forgets the retained output, the next render() draws every pass
+        if self.retained_key is not None:
+            self.outputs.invalidate([self.retained_key])
+        self.retained_key = None
+        self.last_keys = []
+
+    def vram(self) -> dict:
+        # Bytes of the targets the graph holds on to, each aliased target counted once
+        retained = self.outputs.entries.get(self.retained_key) if self.retained_key is not None else None
+        usage = {
+            "targets": sum(target.nbytes for target in self.targets),
+            "held": sum(target.nbytes for target in self.held.values()),
+            "retained": retained.nbytes if retained is not None else 0,
+        }
+        usage["total"] = sum(usage.values())
+        return usage
+
+    @staticmethod
+    def args_for(render_pass: RenderPass, args_for_shaders) -> dict:
+        if len(render_pass.indices) > 1:
+            return render_pass.shader.merge_args([
+                args_for_shaders[i] if i < len(args_for_shaders) else RenderGraph.NO_ARGS for i in render_pass.indices
+            ])
+        if render_pass.index < len(args_for_shaders):
+            return args_for_shaders[render_pass.index]
+        return RenderGraph.NO_ARGS
+
+    def release(self):
+        self.invalidate()
+        self.set_holding(())
+        self.reuse = None
+        for target in self.targets:
+            self.pool.release(target)
+        self.targets = []
+        self.passes = []
+        self.fused = []
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+import moderngl
+
+from .ContextLocal import ContextLocal
+
+
+class RenderTarget:
+
+    def __init__(self, key: tuple, texture: moderngl.Texture, fbo: moderngl.Framebuffer, nbytes: int):
+        self.key = key
+        self.texture = texture
+        self.fbo = fbo
+        self.nbytes = nbytes
+
+    @property
+    def size(self):
+        return self.key[0]
+
+    def release(self):
+        self.fbo.release()
+        self.texture.release()
+
+
+class RenderTargetPool(ContextLocal):
+
+    DTYPE_SIZES = {"f1": 1, "f2": 2, "f4": 4, "u1": 1, "u2": 2, "u4": 4, "i1": 1, "i2": 2, "i4": 4}
+    DEFAULT_FILTER = (moderngl.LINEAR, moderngl.LINEAR)
+    # How narrow targets read: one component as grey, two as the .rg they were written with, three as opaque RGB
+    SWIZZLES = {1: "RRR1", 2: "RG01", 3: "RGB1"}
+
+    def __init__(self, ctx: moderngl.Context, max_bytes: int = 256 * 1024 * 1024, max_free_targets: int = 16):
+        self.ctx = ctx
+        self.max_bytes = max_bytes
+        self.max_free_targets = max_free_targets
+        self._free = {}  # key -> [RenderTarget]
+        self._lru = OrderedDict()  # free RenderTarget -> None, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_resident = 0
+        self.leased = 0
+
+    @staticmethod
+    def make_key(size, components=4, dtype="f1", filter=None) -> tuple:
+        if filter is None:
+            filter = RenderTargetPool.DEFAULT_FILTER
+        return (int(size[0]), int(size[1])), components, dtype, tuple(filter)
+
+    def lease(self, size, components=4, dtype="f1", filter=None) -> RenderTarget:
+        key = RenderTargetPool.make_key(size, components, dtype, filter)
+        free = self._free.get(key)
+        if free:
+            target = free.pop()
+            del self._lru[target]
+            self.hits += 1
+        else:
+            target = self._allocate(key)
+            self.misses += 1
+        self.leased += 1
+        return target
+
+    def release(self, target: RenderTarget):
+        self.leased -= 1
+        self._free.setdefault(target.key, []).append(target)
+        self._lru[target] = None
+        self._evict()
+
+    def clear(self):
+        # Frees every idle target, leased ones stay with their owners
+        while self._lru:
+            self._evict_oldest()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes_resident": self.bytes_resident,
+            "leased": self.leased,
+            "free": len(self._lru),
+        }
+
+    def _allocate(self, key: tuple) -> RenderTarget:
+        size, components, dtype, filter = key
+        texture = self.ctx.texture(size, components, dtype=dtype)
+        texture.filter = filter
+        if components < 4:
+            texture.swizzle = RenderTargetPool.SWIZZLES[components]
+        fbo = self.ctx.framebuffer(color_attachments=[texture])
+        nbytes = size[0] * size[1] * components * RenderTargetPool.DTYPE_SIZES[dtype]
+        self.bytes_resident += nbytes
+        self._evict()
+        return RenderTarget(key, texture, fbo, nbytes)
+
+    def _evict(self):
+        while self._lru and (self.bytes_resident > self.max_bytes or len(self._lru) > self.max_free_targets):
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        target, _ = self._lru.popitem(last=False)
+        self._free[target.key].remove(target)
+        if not self._free[target.key]:
+            del self._free[target.key]
+        self.bytes_resident -= target.nbytes
+        self.evictions += 1
+        target.release()
@@ -0,0 +1,13 @@
+#version 460 core
+
+in vec2 uvs;
+uniform sampler2D tex;
+uniform sampler2D bloom;     // blurred bright parts, the first level of the bloom pyramid
+uniform float u_intensity;
+
+out vec4 fragColor;
+
+void main() {
+    vec4 scene = texture(tex, uvs);
+    fragColor = vec4(scene.rgb + texture(bloom, uvs).rgb * u_intensity, scene.a);
+}
\ No newline at end of file
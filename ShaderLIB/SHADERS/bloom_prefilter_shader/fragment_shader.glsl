@@ -0,0 +1,26 @@
+#version 460 core
+
+in vec2 uvs;
+uniform sampler2D tex;
+uniform vec2 u_halfpixel;   // half a texel of tex in uv units
+uniform float u_threshold;  // brightness where bloom starts
+uniform float u_knee;       // width of the soft ramp below the threshold
+
+out vec4 fragColor;
+
+void main() {
+    // Same taps as the dual filter downsample, then only the part brighter than the threshold is kept
+    vec4 sum = texture(tex, uvs) * 4.0;
+    sum += texture(tex, uvs - u_halfpixel);
+    sum += texture(tex, uvs + u_halfpixel);
+    sum += texture(tex, uvs + vec2(u_halfpixel.x, -u_halfpixel.y));
+    sum += texture(tex, uvs - vec2(u_halfpixel.x, -u_halfpixel.y));
+    vec3 color = sum.rgb / 8.0;
+
+    float brightness = max(color.r, max(color.g, color.b));
+    float soft = clamp(brightness - u_threshold + u_knee, 0.0, 2.0 * u_knee);
+    soft = soft * soft / (4.0 * u_knee + 0.00001);
+    float contribution = max(soft, brightness - u_threshold) / max(brightness, 0.00001);
+
+    fragColor = vec4(color * contribution, 1.0);
+}
\ No newline at end of file
@@ -5,7 +5,10 @@ in vec2 texcoord;
 
 out vec2 uvs;
 
+// Column major 2D transform applied to the quad, identity unless Shader.set_transform says otherwise
+uniform mat4 u_transform;
+
 void main(){
     uvs = texcoord;
-    gl_Position = vec4(vert.x, vert.y, 0.0, 1.0);
+    gl_Position = u_transform * vec4(vert.x, vert.y, 0.0, 1.0);
 }
\ No newline at end of file
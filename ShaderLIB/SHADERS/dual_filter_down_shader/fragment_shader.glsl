@@ -0,0 +1,19 @@
+#version 460 core
+
+in vec2 uvs;
+uniform sampler2D tex;
+uniform vec2 u_halfpixel;   // half a texel of tex in uv units
+uniform float u_offset;     // spreads the taps, 1.0 is the plain dual filter
+
+out vec4 fragColor;
+
+void main() {
+    // Dual filter downsample: the centre weighted 4 and four diagonal taps between texels, 5 bilinear fetches
+    vec2 o = u_halfpixel * u_offset;
+    vec4 sum = texture(tex, uvs) * 4.0;
+    sum += texture(tex, uvs - o);
+    sum += texture(tex, uvs + o);
+    sum += texture(tex, uvs + vec2(o.x, -o.y));
+    sum += texture(tex, uvs - vec2(o.x, -o.y));
+    fragColor = sum / 8.0;
+}
\ No newline at end of file
@@ -0,0 +1,22 @@
+#version 460 core
+
+in vec2 uvs;
+uniform sampler2D tex;
+uniform vec2 u_halfpixel;   // half a texel of tex in uv units
+uniform float u_offset;     // spreads the taps, 1.0 is the plain dual filter
+
+out vec4 fragColor;
+
+void main() {
+    // Dual filter upsample: a ring of 4 edge taps weighted 1 and 4 diagonal taps weighted 2
+    vec2 o = u_halfpixel * u_offset;
+    vec4 sum = texture(tex, uvs + vec2(-o.x * 2.0, 0.0));
+    sum += texture(tex, uvs + vec2(-o.x, o.y)) * 2.0;
+    sum += texture(tex, uvs + vec2(0.0, o.y * 2.0));
+    sum += texture(tex, uvs + vec2(o.x, o.y)) * 2.0;
+    sum += texture(tex, uvs + vec2(o.x * 2.0, 0.0));
+    sum += texture(tex, uvs + vec2(o.x, -o.y)) * 2.0;
+    sum += texture(tex, uvs + vec2(0.0, -o.y * 2.0));
+    sum += texture(tex, uvs + vec2(-o.x, -o.y)) * 2.0;
+    fragColor = sum / 12.0;
+}
\ No newline at end of file
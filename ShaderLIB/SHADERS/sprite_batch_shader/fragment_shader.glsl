@@ -0,0 +1,11 @@
+#version 460 core
+
+in vec2 uvs;
+in vec4 tint;
+uniform sampler2D tex;
+
+out vec4 fragColor;
+
+void main() {
+    fragColor = texture(tex, uvs) * tint;
+}
\ No newline at end of file
@@ -0,0 +1,22 @@
+#version 460 core
+
+// Corner of the shared quad, (0, 0) top left to (1, 1) bottom right
+in vec2 texcoord;
+
+// Per instance: top left and size in pixels, atlas UV rect (u0, v0, u1, v1) and tint
+in vec2 in_pos;
+in vec2 in_size;
+in vec4 in_uv;
+in vec4 in_tint;
+
+uniform vec2 screen_size;
+
+out vec2 uvs;
+out vec4 tint;
+
+void main(){
+    vec2 pixel = in_pos + texcoord * in_size;
+    uvs = mix(in_uv.xy, in_uv.zw, texcoord);
+    tint = in_tint;
+    gl_Position = vec4(pixel.x / screen_size.x * 2.0 - 1.0, 1.0 - pixel.y / screen_size.y * 2.0, 0.0, 1.0);
+}
\ No newline at end of file
@@ -1,11 +1,19 @@
 import moderngl
 import pygame
+import math
 import os
+import re
 from array import array
 
+from .BufferTexture import BufferTexture
+from .RenderTargetPool import RenderTargetPool
+from .ShaderCache import ShaderCache
+from .SurfaceTextureCache import SurfaceTextureCache
+
 class Shader:
 
-    DEFAULT_SHADER_DIR = "ShaderLIB/SHADERS/default_pipline_render_shader"
+    # Next to this module, so it's found whatever the working directory
+    DEFAULT_SHADER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SHADERS", "default_pipline_render_shader")
 
     VERTEX_SHADER_PREFIX = "vertex_shader.glsl"
     FRAGMENT_SHADER_PREFIX = "fragment_shader.glsl"
@@ -13,93 +21,285 @@ class Shader:
     # Prefixes for identifying types
     SAMPLE2D_PREFIX = "sample2D_"
 
-    def __init__(self, shader_dir_loc: str, ctx: moderngl.Context, screen_size = (1920, 1080)):
+    # GL types of the sampler uniforms sample2D_ textures can be bound to
+    SAMPLER_TYPES = {0x8B5D, 0x8B5E, 0x8B5F, 0x8B60, 0x8B62, 0x8DC1, 0x8DCA, 0x8DD2}
+
+    TRANSFORM_UNIFORM = "u_transform"
+    IDENTITY_TRANSFORM = (
+        1.0, 0.0, 0.0, 0.0,
+        0.0, 1.0, 0.0, 0.0,
+        0.0, 0.0, 1.0, 0.0,
+        0.0, 0.0, 0.0, 1.0,
+    )
+
+    def __init__(self, shader_dir_loc: str, ctx: moderngl.Context, screen_size = (1920, 1080), vertex_shader: str = None, fragment_shader: str = None):
+        # Sources passed in (e.g. generated ones) take the place of the files in shader_dir_loc
         self.dir_loc = shader_dir_loc
+        self.name = os.path.basename(os.path.normpath(shader_dir_loc))
         self.screen_size = screen_size
-        self.vertex_shader = self.get_vertex_shader()
-        self.fragment_shader = self.get_fragment_shader()
         self.ctx = ctx
-        self.full_screen_render_quads = Shader.create_full_screen_quad(self.ctx)
-        self.program = self.ctx.program(vertex_shader=self.vertex_shader, fragment_shader=self.fragment_shader)
-        self.full_screen_render_object = self.ctx.vertex_array(self.program, [(self.full_screen_render_quads, '2f 2f', 'vert', 'texcoord')])
-        self.flipped_fs_quads = Shader.get_flipped_fs_quads(self.ctx)
+        # Sources, programs, the full screen quads and their vertex arrays are shared per context
+        self.cache = ShaderCache.for_context(self.ctx)
+        self.vertex_shader = vertex_shader if vertex_shader is not None else self.get_vertex_shader()
+        self.fragment_shader = fragment_shader if fragment_shader is not None else self.get_fragment_shader()
+        self.program = self.cache.program(self.vertex_shader, self.fragment_shader)
+        self.full_screen_render_quads = self.cache.quad("full_screen", Shader.create_full_screen_quad)
+        self.full_screen_render_object = self.cache.vertex_array(self.program, "full_screen", Shader.create_full_screen_quad)
+        self.flipped_fs_quads = self.cache.quad("flipped_full_screen", Shader.get_flipped_fs_quads)
+        self.flipped_render_object = self.cache.vertex_array(self.program, "flipped_full_screen", Shader.get_flipped_fs_quads)
+        self.uniform_values = self.cache.uniform_values(self.program)
+        # Uniform locations resolved once, writes of unchanged values are skipped
+        self.uniforms = {name: self.program[name] for name in self.program if isinstance(self.program[name], moderngl.Uniform)}
+        self.has_transform = Shader.TRANSFORM_UNIFORM in self.uniforms
+        # tex is on unit 0, every other sampler gets its own unit for the lifetime of the shader
+        samplers = sorted(name for name, uniform in self.uniforms.items() if uniform.gl_type in Shader.SAMPLER_TYPES and name != "tex")
+        self.texture_units = {name: unit + 1 for unit, name in enumerate(samplers)}
+        self.textures = {}  # sampler name -> (Texture, owned)
+        # Streaming textures for buffer-protocol inputs, the render input and per sample2D_ sampler
+        self.input_buffer = None
+        self.sampler_buffers = {}
+        self.transform = Shader.IDENTITY_TRANSFORM
+        # Quad placing a surface at its destination, created on the first render()
+        self.sprite_quads = None
+        self.sprite_render_object = None
+        self.sprite_vertices = None
+        # FrameProfiler timing every render of this shader, None leaves them uninstrumented
+        self.profiler = None
+        # Bumped by every successful reload(), graphs built on the old program rebuild when it changes
+        self.generation = 0
+        self.reload_error = None  # compiler log of the last failed reload(), None after a successful one
 
-    def render_texture(self, tex: moderngl.Texture, fbo: moderngl.Framebuffer = None, flip_y=False,**kwargs):
+    def render_texture(self, tex: moderngl.Texture, fbo: moderngl.Framebuffer = None, flip_y=False, region=None, margin=0, **kwargs):
+        # region=(x, y, width, height) in screen pixels from the top left limits the pixels shaded, widened by
+        # margin for effects that sample their neighbours
         if fbo is None:
             fbo = self.ctx.screen
+        if self.profiler is not None:
+            token = self.profiler.begin_pass(self.name, fbo.size)
+        if region is not None:
+            fbo.scissor = Shader.scissor_box(region, margin, fbo.size, self.screen_size)
         fbo.use()
-        renderer = self.full_screen_render_object
-        if flip_y:
-            renderer = self.ctx.vertex_array(self.program, [(self.flipped_fs_quads, '2f 2f', 'vert', 'texcoord')])
-        tex.use(0)
-        self.program["tex"] = 0
-        sample2D_list_to_release = []
-        for k, v in kwargs.items():
-            if k.startswith(Shader.SAMPLE2D_PREFIX):
-                sample2D_list_to_release.append(v)
-                self.program[k[len(Shader.SAMPLE2D_PREFIX):]] = v
-                continue
-            self.program[k] = v
-        renderer.render(mode=moderngl.TRIANGLE_STRIP)
-        for i, v in enumerate(sample2D_list_to_release):
-            v.release()
-        if renderer is not self.full_screen_render_object:
-            renderer.release()
+        renderer = self.flipped_render_object if flip_y else self.full_screen_render_object
+        self.draw(renderer, tex, kwargs)
+        if region is not None:
+            fbo.scissor = None
+        if self.profiler is not None:
+            self.profiler.end_pass(token)
 
-    def render_frame_buffer(self, fbo: moderngl.Framebuffer = None, flip_y=False,**kwargs):
-        color_texture = self.ctx.texture(self.screen_size, 4)  # RGBA texture
+    def render_frame_buffer(self, fbo: moderngl.Framebuffer = None, flip_y=False, region=None, margin=0, **kwargs):
+        # region and margin as in render_texture, pixels outside them are left as they are
+        if fbo is None:
+            fbo = self.ctx.screen
+        if self.profiler is not None:
+            token = self.profiler.begin_pass(self.name, fbo.size)
+        # Target leased from the context's pool instead of allocated per call, in the framebuffer's format
+        # so float (HDR) framebuffers aren't clamped and narrow ones don't pay for RGBA on the way through
+        pool = RenderTargetPool.for_context(self.ctx)
+        output = fbo.color_attachments[0]
+        target = pool.lease(self.screen_size, output.components, output.dtype)
+        fboRenderer = target.fbo
 
-        # Create the framebuffer
-        fboRenderer = self.ctx.framebuffer(
-            color_attachments=[color_texture],
-        )
+        renderer = self.flipped_render_object if flip_y else self.full_screen_render_object
+        if region is None:
+            fboRenderer.use()
+            fboRenderer.clear()
+            self.draw(renderer, fbo.color_attachments[0], kwargs)
+            self.ctx.copy_framebuffer(fbo, fboRenderer)
+        else:
+            # Copy the input aside and shade only the box of fbo, the rest of it keeps its pixels
+            self.ctx.copy_framebuffer(fboRenderer, fbo)
+            box = Shader.scissor_box(region, margin, fbo.size, self.screen_size)
+            fbo.clear(viewport=box)
+            fbo.scissor = box
+            fbo.use()
+            self.draw(renderer, fboRenderer.color_attachments[0], kwargs)
+            fbo.scissor = None
+        pool.release(target)
+        if self.profiler is not None:
+            self.profiler.end_pass(token)
 
+    def render(self, surf, pos_rect: pygame.Rect, fbo: moderngl.Framebuffer = None, dirty_rect=None, **kwargs):
+        # surf streams into its persistent texture, dirty_rect limits the upload to the part that changed.
+        # surf may also be a buffer-protocol object (see Shader.upload)
         if fbo is None:
             fbo = self.ctx.screen
-        fboRenderer.use()
-        renderer = self.full_screen_render_object
-        if flip_y:
-            renderer = self.ctx.vertex_array(self.program, [(self.flipped_fs_quads, '2f 2f', 'vert', 'texcoord')])
-        tex = fbo.color_attachments[0]
+        if self.profiler is not None:
+            token = self.profiler.begin_pass(self.name, fbo.size)
+        fbo.use()
+        frame_tex = self.upload(surf, dirty_rect, pos_rect)
+        vertices = Shader.quad_vertices(frame_tex.size, (pos_rect[0], pos_rect[1]), self.screen_size)
+        if self.sprite_quads is None:
+            self.sprite_quads = self.ctx.buffer(reserve=16 * 4)
+            self.sprite_render_object = self.ctx.vertex_array(self.program, [ShaderCache.quad_format(self.program, self.sprite_quads)])
+        if vertices != self.sprite_vertices:
+            self.sprite_quads.write(array('f', vertices))
+            self.sprite_vertices = vertices
+        self.draw(self.sprite_render_object, frame_tex, kwargs)
+        if self.profiler is not None:
+            self.profiler.end_pass(token)
+
+    def upload(self, surf, dirty_rect=None, pos_rect=None) -> moderngl.Texture:
+        # Surfaces go through the context's SurfaceTextureCache. NumPy arrays, memoryviews and bytes are written
+        # as they are into this shader's input texture: (height, width[, components]) uint8 / float16 / float32,
+        # flat buffers take their size from a (x, y, width, height) pos_rect
+        if isinstance(surf, pygame.Surface):
+            return SurfaceTextureCache.for_context(self.ctx).upload(surf, dirty_rect)
+        if self.input_buffer is None:
+            self.input_buffer = BufferTexture(self.ctx)
+        size = pos_rect[2:4] if pos_rect is not None and len(pos_rect) == 4 else None
+        return self.input_buffer.upload(surf, size, dirty_rect)
+
+    def input_version(self, surf):
+        # Stamp of the last upload of surf, see SurfaceTextureCache.version
+        if isinstance(surf, pygame.Surface):
+            return SurfaceTextureCache.for_context(self.ctx).version(surf)
+        return None if self.input_buffer is None else self.input_buffer.version
+
+    def draw(self, renderer: moderngl.VertexArray, tex: moderngl.Texture, kwargs: dict):
+        # Shared tail of the render methods, the target framebuffer is already in use
+        self.apply_transform()
         tex.use(0)
-        self.program["tex"] = 0
-        sample2D_list_to_release = []
-        for k, v in kwargs.items():
-            if k.startswith(Shader.SAMPLE2D_PREFIX):
-                sample2D_list_to_release.append(v)
-                self.program[k[len(Shader.SAMPLE2D_PREFIX):]] = v
-                continue
-            self.program[k] = v
+        if "tex" in self.uniforms:
+            self.write_uniform("tex", 0)
+        self.write_uniforms(kwargs)
         renderer.render(mode=moderngl.TRIANGLE_STRIP)
-        self.ctx.copy_framebuffer(fbo, fboRenderer)
-        for i, v in enumerate(sample2D_list_to_release):
-            v.release()
-        if renderer is not self.full_screen_render_object:
-            renderer.release()
-        color_texture.release()
-        fboRenderer.release()
-
-    def render(self, surf: pygame.Surface, pos_rect: pygame.Rect, fbo: moderngl.Framebuffer = None, **kwargs):
-        if fbo is None:
-            fbo = self.ctx.screen
-        fbo.use()
-        o = pygame.Surface(self.screen_size, pygame.SRCALPHA).convert_alpha()
-        o.fill((0, 0, 0, 0))
-        o.blit(surf, pos_rect)
-        frame_tex = Shader.surf_to_texture(o, self.ctx)
-        frame_tex.use(0)
-        self.program["tex"] = 0
-        sample2D_list_to_release = []
+
+    def is_identity(self) -> bool:
+        # True when drawing with the flipped quad is a plain copy of tex: the default vertex shader,
+        # an identity transform, no extra inputs and a main() that only writes texture(tex, uvs)
+        if self.transform != Shader.IDENTITY_TRANSFORM or self.textures:
+            return False
+        if not self.has_default_vertex_shader():
+            return False
+        if set(self.uniforms) - {"tex", Shader.TRANSFORM_UNIFORM}:
+            return False
+        return re.search(r"voidmain\(\)\{(\w+)=texture\(tex,uvs\);\}", Shader.normalize_source(self.fragment_shader)) is not None
+
+    def has_default_vertex_shader(self) -> bool:
+        default_vertex = self.cache.read_source(os.path.join(Shader.DEFAULT_SHADER_DIR, Shader.VERTEX_SHADER_PREFIX))
+        return Shader.normalize_source(self.vertex_shader) == Shader.normalize_source(default_vertex)
+
+    @staticmethod
+    def normalize_source(source: str) -> str:
+        # Drops comments and whitespace so sources can be compared structurally
+        source = re.sub(r"/\*.*?\*/", "", source, flags=re.DOTALL)
+        source = re.sub(r"//[^\n]*", "", source)
+        return re.sub(r"\s+", "", source)
+
+    def write_uniforms(self, kwargs: dict):
+        # sample2D_<name> textures are bound for this draw only and stay owned by the caller,
+        # shaped buffers (NumPy arrays, memoryviews) are uploaded to a texture kept for the sampler
+        for name, (texture, _) in self.textures.items():
+            self.bind_texture(name, texture)
         for k, v in kwargs.items():
             if k.startswith(Shader.SAMPLE2D_PREFIX):
-                sample2D_list_to_release.append(v)
-                self.program[k[len(Shader.SAMPLE2D_PREFIX):]] = v
+                name = k[len(Shader.SAMPLE2D_PREFIX):]
+                if BufferTexture.is_buffer(v):
+                    v = self.sampler_buffer(name).upload(v)
+                self.bind_texture(name, v)
                 continue
-            self.program[k] = v
-        self.full_screen_render_object.render(mode=moderngl.TRIANGLE_STRIP)
-        frame_tex.release()
-        for i, v in enumerate(sample2D_list_to_release):
-            v.release()
+            self.write_uniform(k, v)
+
+    def bind_texture(self, name: str, texture: moderngl.Texture):
+        unit = self.texture_units[name]
+        texture.use(unit)
+        self.write_uniform(name, unit)
+
+    def sampler_buffer(self, name: str) -> BufferTexture:
+        if name not in self.texture_units:
+            raise KeyError(f"{name} is not a sampler of {self.dir_loc}")
+        buffer = self.sampler_buffers.get(name)
+        if buffer is None:
+            buffer = self.sampler_buffers[name] = BufferTexture(self.ctx)
+        return buffer
+
+    def set_texture(self, name: str, texture: moderngl.Texture, owned=False):
+        # Keeps texture bound to sampler name on every render, owned=True hands its release to the shader
+        if name not in self.texture_units:
+            raise KeyError(f"{name} is not a sampler of {self.dir_loc}")
+        self.remove_texture(name)
+        self.textures[name] = (texture, owned)
+
+    def remove_texture(self, name: str):
+        texture, owned = self.textures.pop(name, (None, False))
+        if owned:
+            texture.release()
+
+    def release_textures(self):
+        for name in list(self.textures):
+            self.remove_texture(name)
+        for buffer in self.sampler_buffers.values():
+            buffer.release()
+        self.sampler_buffers = {}
+        if self.input_buffer is not None:
+            self.input_buffer.release()
+            self.input_buffer = None
+
+    def write_uniform(self, name: str, value):
+        if isinstance(value, list):
+            value = tuple(value)
+        elif hasattr(value, "tolist"):
+            value = value.tolist()
+            value = tuple(value) if isinstance(value, list) else value
+        if name in self.uniform_values and self.uniform_values[name] == value:
+            return
+        self.uniforms[name].value = value
+        self.uniform_values[name] = value
+
+    def invalidate_uniforms(self):
+        # Call after writing to self.program directly so the next render rewrites every uniform
+        self.uniform_values.clear()
+
+    def use_uniform_block(self, block) -> bool:
+        # Points the program's block of the same name at block's binding, False if it doesn't declare one
+        if block.name not in self.program:
+            return False
+        self.program[block.name].binding = block.binding
+        return True
+
+    def set_transform(self, matrix=None):
+        # matrix is a column major 4x4 (see Shader.transform_matrix), None resets to identity
+        matrix = Shader.IDENTITY_TRANSFORM if matrix is None else tuple(float(v) for v in matrix)
+        if not self.has_transform and matrix != Shader.IDENTITY_TRANSFORM:
+            raise ValueError(f"The vertex shader of {self.dir_loc} has no {Shader.TRANSFORM_UNIFORM} uniform")
+        self.transform = matrix
+
+    def apply_transform(self):
+        # Only writes the uniform when another Shader sharing the program left a different matrix
+        if self.has_transform:
+            self.write_uniform(Shader.TRANSFORM_UNIFORM, self.transform)
+
+    @staticmethod
+    def transform_matrix(scale=(1.0, 1.0), offset=(0.0, 0.0), flip_x=False, flip_y=False) -> tuple:
+        # Offset is in normalized device coordinates, applied after scaling and flipping
+        sx = -scale[0] if flip_x else scale[0]
+        sy = -scale[1] if flip_y else scale[1]
+        return (
+            float(sx), 0.0, 0.0, 0.0,
+            0.0, float(sy), 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            float(offset[0]), float(offset[1]), 0.0, 1.0,
+        )
+
+    @staticmethod
+    def destination_rect(surf, pos_rect) -> tuple:
+        # Screen rectangle Shader.render covers with surf, (x, y, width, height) from the top left
+        if isinstance(surf, pygame.Surface):
+            size = surf.get_size()
+        else:
+            size = BufferTexture.layout(surf, pos_rect[2:4] if len(pos_rect) == 4 else None)[1]
+        return pos_rect[0], pos_rect[1], size[0], size[1]
+
+    @staticmethod
+    def scissor_box(region, margin, size, screen_size) -> tuple:
+        # region (screen pixels, from the top left) grown by margin and scaled to a target of size, as a
+        # GL box from the bottom left. Rounded outwards and clipped to the target
+        sx, sy = size[0] / screen_size[0], size[1] / screen_size[1]
+        left = max(0, math.floor((region[0] - margin) * sx))
+        right = min(size[0], math.ceil((region[0] + region[2] + margin) * sx))
+        top = max(0, math.floor((region[1] - margin) * sy))
+        bottom = min(size[1], math.ceil((region[1] + region[3] + margin) * sy))
+        return left, size[1] - bottom, max(0, right - left), max(0, bottom - top)
 
     @staticmethod
     def surf_to_texture(surf: pygame.Surface, ctx: moderngl.Context):
@@ -111,18 +311,21 @@ class Shader:
 
     @staticmethod
     def create_quad(surf: pygame.Surface, top_left: tuple[float, float], screen_size: tuple[int, int], ctx: moderngl.Context):
+        quad_buffer = ctx.buffer(data=array('f', Shader.quad_vertices(surf.get_size(), top_left, screen_size)))
+
+        return quad_buffer
+
+    @staticmethod
+    def quad_vertices(size: tuple[int, int], top_left: tuple[float, float], screen_size: tuple[int, int]) -> tuple:
         x, y = 2 * ((top_left[0] / screen_size[0]) - 0.5), -2 * ((top_left[1] / screen_size[1]) - 0.5)
-        width_r, height_r = 2 * (surf.get_size()[0] / screen_size[0]), -2 * (surf.get_size()[1] / screen_size[1])
-        vert = [
+        width_r, height_r = 2 * (size[0] / screen_size[0]), -2 * (size[1] / screen_size[1])
+        return (
             # Pose (x,y), UV (UVx, UVy)
             x, y, 0.0, 0.0,  # Top Left
             x + width_r, y, 1.0, 0.0,  # Top Right
             x, y + height_r, 0.0, 1.0,  # Bottom Left
             x + width_r, y + height_r, 1.0, 1.0,  # Bottom Right
-        ]
-        quad_buffer = ctx.buffer(data=array('f', vert))
-
-        return quad_buffer
+        )
 
     @staticmethod
     def create_full_screen_quad(ctx: moderngl.Context):
@@ -146,27 +349,76 @@ class Shader:
         ]))
         return quad_buffer
 
+    def reload(self, vertex_shader: str = None, fragment_shader: str = None) -> bool:
+        # Compiles new sources (the files in dir_loc by default) and swaps them in between two draws. Uniform
+        # values of the same name and type, sampler bindings and uniform block bindings carry over. A source
+        # that doesn't compile leaves the shader as it was and its log in reload_error
+        if vertex_shader is None or fragment_shader is None:
+            self.cache.forget_sources(self.dir_loc)
+        vertex_shader = vertex_shader if vertex_shader is not None else self.get_vertex_shader()
+        fragment_shader = fragment_shader if fragment_shader is not None else self.get_fragment_shader()
+        try:
+            program = self.cache.program(vertex_shader, fragment_shader)
+        except moderngl.Error as e:
+            self.reload_error = str(e)
+            return False
+        self.reload_error = None
+        if program is self.program:
+            return True
+
+        full_screen_render_object = self.cache.vertex_array(program, "full_screen", Shader.create_full_screen_quad)
+        flipped_render_object = self.cache.vertex_array(program, "flipped_full_screen", Shader.get_flipped_fs_quads)
+        uniforms = {name: program[name] for name in program if isinstance(program[name], moderngl.Uniform)}
+        uniform_values = self.cache.uniform_values(program)
+        for name, value in self.uniform_values.items():
+            old, new = self.uniforms.get(name), uniforms.get(name)
+            if old is not None and new is not None and (old.gl_type, old.array_length) == (new.gl_type, new.array_length) \
+                    and name not in uniform_values:
+                new.value = value
+                uniform_values[name] = value
+        for name in self.program:
+            if isinstance(self.program[name], moderngl.UniformBlock) and name in program:
+                program[name].binding = self.program[name].binding
+        samplers = sorted(name for name, uniform in uniforms.items() if uniform.gl_type in Shader.SAMPLER_TYPES and name != "tex")
+        sprite_render_object = None
+        if self.sprite_quads is not None:
+            sprite_render_object = self.ctx.vertex_array(program, [ShaderCache.quad_format(program, self.sprite_quads)])
+
+        # Everything the next draw reads is replaced together
+        self.vertex_shader, self.fragment_shader = vertex_shader, fragment_shader
+        self.program = program
+        self.full_screen_render_object = full_screen_render_object
+        self.flipped_render_object = flipped_render_object
+        self.uniform_values = uniform_values
+        self.uniforms = uniforms
+        self.has_transform = Shader.TRANSFORM_UNIFORM in uniforms
+        self.texture_units = {name: unit + 1 for unit, name in enumerate(samplers)}
+        for name in [name for name in self.textures if name not in self.texture_units]:
+            self.remove_texture(name)
+        for name in [name for name in self.sampler_buffers if name not in self.texture_units]:
+            self.sampler_buffers.pop(name).release()
+        if sprite_render_object is not None:
+            self.sprite_render_object.release()
+            self.sprite_render_object = sprite_render_object
+        if not self.has_transform:
+            self.transform = Shader.IDENTITY_TRANSFORM
+        self.generation += 1
+        return True
+
     def get_vertex_shader(self) -> str:
-        shader_vert_path = os.path.join(self.dir_loc, Shader.VERTEX_SHADER_PREFIX)
-        if not os.path.exists(shader_vert_path):
-            shader_vert_path = os.path.join(Shader.DEFAULT_SHADER_DIR, Shader.VERTEX_SHADER_PREFIX)
-            if not os.path.exists(shader_vert_path):
-                raise FileNotFoundError("Default Shader Vertex file was not found!")
-        contents = ""
-        with open(shader_vert_path, "r") as f:
-            contents = f.read()
-        return contents
+        return self.read_shader_file(Shader.VERTEX_SHADER_PREFIX)
 
     def get_fragment_shader(self) -> str:
-        shader_vert_path = os.path.join(self.dir_loc, Shader.FRAGMENT_SHADER_PREFIX)
-        if not os.path.exists(shader_vert_path):
-            shader_vert_path = os.path.join(Shader.DEFAULT_SHADER_DIR, Shader.FRAGMENT_SHADER_PREFIX)
-            if not os.path.exists(shader_vert_path):
-                raise FileNotFoundError("Default Shader Fragment file was not found!")
-        contents = ""
-        with open(shader_vert_path, "r") as f:
-            contents = f.read()
-        return contents
+        return self.read_shader_file(Shader.FRAGMENT_SHADER_PREFIX)
+
+    def read_shader_file(self, file_name: str) -> str:
+        # The file in dir_loc, or the default pipeline's. Reads (and misses) are cached per context
+        source = self.cache.read_source(os.path.join(self.dir_loc, file_name), missing_ok=True)
+        if source is None:
+            source = self.cache.read_source(os.path.join(Shader.DEFAULT_SHADER_DIR, file_name), missing_ok=True)
+            if source is None:
+                raise FileNotFoundError(f"Default Shader {file_name} was not found!")
+        return source
 
 
 
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+
+import moderngl
+
+from .ContextLocal import ContextLocal
+
+
+class ShaderCache(ContextLocal):
+
+    def __init__(self, ctx: moderngl.Context):
+        self.ctx = ctx
+        self.sources = {}  # absolute path -> GLSL source, None for a missing file
+        # Sources are read off the GL thread too (ShaderRegistry.precompile), every access to them holds this
+        self.sources_lock = threading.Lock()
+        self.programs = {}  # source hash -> Program
+        self.quads = {}  # name -> Buffer
+        self.vertex_arrays = {}  # (Program, quad name) -> VertexArray
+        self.uniform_state = {}  # Program -> {uniform name: last written value}
+        self.compiles = 0
+
+    @staticmethod
+    def source_hash(vertex_shader: str, fragment_shader: str) -> str:
+        return hashlib.sha1(f"{vertex_shader}\0{fragment_shader}".encode()).hexdigest()
+
+    def read_source(self, path: str, missing_ok=False) -> str | None:
+        # Files are read once, missing ones are remembered too (None with missing_ok, FileNotFoundError otherwise)
+        path = os.path.abspath(path)
+        with self.sources_lock:
+            cached = path in self.sources
+            source = self.sources.get(path)
+        if not cached:
+            try:
+                with open(path, "r") as f:
+                    source = f.read()
+            except FileNotFoundError:
+                source = None
+            with self.sources_lock:
+                # A read racing this one on another thread got there first, both saw the same file
+                source = self.sources.setdefault(path, source)
+        if source is None and not missing_ok:
+            raise FileNotFoundError(path)
+        return source
+
+    def set_source(self, path: str, source: str | None):
+        # Replaces a cached read, e.g. with a file's new contents read off the GL thread
+        with self.sources_lock:
+            self.sources[os.path.abspath(path)] = source
+
+    def forget_sources(self, directory: str):
+        # The next read_source of a file in directory goes back to the disk
+        directory = os.path.abspath(directory)
+        with self.sources_lock:
+            for path in [path for path in self.sources if os.path.dirname(path) == directory]:
+                del self.sources[path]
+
+    def program(self, vertex_shader: str, fragment_shader: str) -> moderngl.Program:
+        key = ShaderCache.source_hash(vertex_shader, fragment_shader)
+        program = self.programs.get(key)
+        if program is None:
+            program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+            self.programs[key] = program
+            self.compiles += 1
+        return program
+
+    def uniform_values(self, program: moderngl.Program) -> dict:
+        # Uniforms live on the program, which Shader instances share, so the last written values do too
+        values = self.uniform_state.get(program)
+        if values is None:
+            values = {}
+            self.uniform_state[program] = values
+        return values
+
+    def quad(self, name: str, create) -> moderngl.Buffer:
+        # create(ctx) builds the buffer the first time name is asked for
+        buffer = self.quads.get(name)
+        if buffer is None:
+            buffer = create(self.ctx)
+            self.quads[name] = buffer
+        return buffer
+
+    def vertex_array(self, program: moderngl.Program, quad_name: str, create) -> moderngl.VertexArray:
+        key = (program, quad_name)
+        vertex_array = self.vertex_arrays.get(key)
+        if vertex_array is None:
+            quad = self.quad(quad_name, create)
+            vertex_array = self.ctx.vertex_array(program, [ShaderCache.quad_format(program, quad)])
+            self.vertex_arrays[key] = vertex_array
+        return vertex_array
+
+    @staticmethod
+    def quad_format(program: moderngl.Program, quad: moderngl.Buffer) -> tuple:
+        # Attributes the compiler optimized out are skipped instead of failing the vertex array
+        fmt, names = [], []
+        for name in ("vert", "texcoord"):
+            if name in program:
+                fmt.append("2f")
+                names.append(name)
+            else:
+                fmt.append("8x")
+        return (quad, " ".join(fmt), *names)
+
+    def clear(self):
+        for obj in list(self.vertex_arrays.values()) + list(self.programs.values()) + list(self.quads.values()):
+            obj.release()
+        with self.sources_lock:
+            self.sources.clear()
+        self.programs.clear()
+        self.quads.clear()
+        self.vertex_arrays.clear()
+        self.uniform_state.clear()
@@ -1,51 +1,148 @@
+import moderngl
 
-from ShaderLibrary.ShaderLIB.Shader import Shader
+from .Shader import Shader
+from .RenderTargetPool import RenderTargetPool
+from .RenderGraph import RenderGraph, ChainPass
 
 class ShaderChainer:
 
-    def __init__(self, shaders: list[Shader], ctx, screen_size):
+    def __init__(self, shaders: list[Shader | ChainPass], ctx, screen_size, ping_pong=True, fuse=False, memoize=False,
+                 drop_identity=False):
+        # Wrap a shader in ChainPass to give its output a scale or size of its own, a narrower format
+        # (components / dtype, see vram_report()), or to tag it point-wise.
+        # fuse=True merges runs of point-wise passes into one generated program.
+        # memoize=True serves the unchanged prefix of render() from a retained texture, pass an empty
+        # dirty_rect, e.g. (0, 0, 0, 0), to render() while surf stays the same.
+        # drop_identity=True skips plain copies in the middle of the chain, only exact with blending disabled
+        # (drawing through SRC_ALPHA, ONE_MINUS_SRC_ALPHA blending multiplies rgb by alpha and squares alpha)
         self.shaders = shaders
         self.ctx = ctx
         self.screen_size = screen_size
-        self.color_texture = ctx.texture(self.screen_size, 4)  # RGBA texture
+        self.ping_pong = ping_pong
+        self.fuse = fuse
+        self.memoize = memoize
+        self.drop_identity = drop_identity
+        self.profiler = None
+        self.error = None  # why the last compile() after a shader reload kept the previous graph
+        self.pool = RenderTargetPool.for_context(ctx)
+        self.graph = None
+        self.target = None
+        self.color_texture = None
+        self.fbo = None
+        if ping_pong:
+            self.compile()
+        else:
+            # RGBA target leased from the context's pool, returned by release()
+            self.target = self.pool.lease(self.screen_size, 4)
+            self.color_texture = self.target.texture
+            self.fbo = self.target.fbo
 
-        # Create the framebuffer
-        self.fbo = ctx.framebuffer(
-            color_attachments=[self.color_texture],
-        )
+    def compile(self, drop_identity=None) -> RenderGraph:
+        # Call again after changing self.shaders, drop_identity=None keeps the chain's setting
+        if drop_identity is not None:
+            self.drop_identity = drop_identity
+        # Built before the old graph goes, so a reload that breaks the chain can't take the scene down
+        try:
+            graph = RenderGraph(self.shaders, self.ctx, self.screen_size, self.drop_identity, self.fuse, self.memoize)
+        except (ValueError, moderngl.Error) as e:
+            if self.graph is None or not self.graph.stale():
+                raise
+            # e.g. a reloaded pass no longer samples tex: it goes back to the program the graph draws with
+            self.error = str(e)
+            for shader in self.graph.revert():
+                shader.reload_error = self.error
+            return self.graph
+        self.error = None
+        if self.graph is not None:
+            self.graph.release()
+        self.graph = graph
+        for shader in self.graph.fused:
+            shader.profiler = self.profiler
+        if self.graph.targets:
+            self.color_texture = self.graph.targets[0].texture
+            self.fbo = self.graph.targets[0].fbo
+        return self.graph
 
-    def render(self, surf, pos_rect, render_fbo=None, args_for_shaders: list[dict]= None):
-        self.fbo.clear()
-        if args_for_shaders is None:
-            args_for_shaders = []
-            for i in range(len(self.shaders)):
-                args_for_shaders.append({})
-        if len(args_for_shaders) < len(self.shaders):
-            for i in range(len(self.shaders) - len(args_for_shaders)):
-                args_for_shaders.append({})
+    def render(self, surf, pos_rect, render_fbo=None, args_for_shaders: list[dict]= None, dirty_rect=None, bounded=False, margin=0):
+        # bounded=True shades only the rectangle surf lands on, plus margin pixels for effects sampling
+        # their neighbours (e.g. the crt_shader's u_rgb_shift)
+        if not self.ping_pong:
+            self._render_copying(surf, pos_rect, render_fbo, self._pad_args(args_for_shaders), dirty_rect)
+            return
+        if self.graph.stale():
+            self.compile()
+        self.graph.render(surf, pos_rect, render_fbo, args_for_shaders, dirty_rect, bounded, margin)
 
-        for i in range(len(self.shaders) - 1):
-            if i == 0:
-                self.shaders[i].render(surf, pos_rect, self.fbo, **args_for_shaders[i])
-                continue
-            self.shaders[i].render_texture(self.color_texture, self.fbo, **args_for_shaders[i])
-        self.shaders[len(self.shaders)-1].render_texture(self.color_texture, render_fbo, flip_y=True,  **args_for_shaders[len(self.shaders)-1])
+    def render_framebuffer(self, render_fbo=None, args_for_shaders: list[dict]= None, region=None, margin=0):
+        # region=(x, y, width, height) in screen pixels limits every pass to that part of render_fbo
+        if not self.ping_pong:
+            self._render_framebuffer_copying(render_fbo, self._pad_args(args_for_shaders))
+            return
+        if self.graph.stale():
+            self.compile()
+        self.graph.render_framebuffer(render_fbo, args_for_shaders, region, margin)
 
+    def invalidate(self):
+        # Call after changing a surface or texture the chain reads without a new upload, e.g. Texture.write
+        if self.graph is not None:
+            self.graph.invalidate()
 
-    def render_framebuffer(self, render_fbo=None, args_for_shaders: list[dict]= None):
-        self.fbo.clear()
+    def use_uniform_block(self, block):
+        # Shares one block of per frame globals (see UniformBlock.frame_globals) between every pass
+        for shader in self._plain_shaders():
+            shader.use_uniform_block(block)
+
+    def set_profiler(self, profiler):
+        # Times every pass with a FrameProfiler, fused passes report under their joined names. None turns it off
+        self.profiler = profiler
+        for shader in self._plain_shaders():
+            shader.profiler = profiler
+        if self.graph is not None:
+            for shader in self.graph.fused:
+                shader.profiler = profiler
+
+    def vram_report(self) -> dict:
+        # Bytes of GPU memory the chain's targets take, by role. Textures the shaders sample aren't counted
+        usage = self.graph.vram() if self.graph is not None else {"targets": 0, "held": 0, "retained": 0, "total": 0}
+        if self.target is not None:
+            usage["targets"] += self.target.nbytes
+            usage["total"] += self.target.nbytes
+        usage["formats"] = [render_pass.target.key for render_pass in self.graph.passes if render_pass.target is not None] \
+            if self.graph is not None else [self.target.key]
+        return usage
+
+    def _plain_shaders(self) -> list[Shader]:
+        return [ChainPass.wrap(item).shader for item in self.shaders]
+
+    def _pad_args(self, args_for_shaders):
         if args_for_shaders is None:
             args_for_shaders = []
-            for i in range(len(self.shaders)):
-                args_for_shaders.append({})
-        if len(args_for_shaders) < len(self.shaders):
-            for i in range(len(self.shaders) - len(args_for_shaders)):
-                args_for_shaders.append({})
+        return list(args_for_shaders) + [{} for _ in range(len(self.shaders) - len(args_for_shaders))]
 
-        for i in range(len(self.shaders) - 1):
+    def _render_copying(self, surf, pos_rect, render_fbo, args_for_shaders, dirty_rect=None):
+        shaders = self._plain_shaders()
+        self.fbo.clear()
+        for i in range(len(shaders) - 1):
             if i == 0:
-                self.shaders[i].render_frame_buffer(render_fbo, **args_for_shaders[i])
+                shaders[i].render(surf, pos_rect, self.fbo, dirty_rect, **args_for_shaders[i])
                 continue
-            self.shaders[i].render_frame_buffer(render_fbo, **args_for_shaders[i])
-        self.shaders[len(self.shaders) - 1].render_frame_buffer(render_fbo, flip_y=True,
-                                                           **args_for_shaders[len(self.shaders) - 1])
+            shaders[i].render_texture(self.color_texture, self.fbo, **args_for_shaders[i])
+        shaders[len(shaders)-1].render_texture(self.color_texture, render_fbo, flip_y=True,  **args_for_shaders[len(shaders)-1])
+
+    def _render_framebuffer_copying(self, render_fbo, args_for_shaders):
+        shaders = self._plain_shaders()
+        self.fbo.clear()
+        for i in range(len(shaders) - 1):
+            shaders[i].render_frame_buffer(render_fbo, **args_for_shaders[i])
+        shaders[len(shaders) - 1].render_frame_buffer(render_fbo, flip_y=True,
+                                                           **args_for_shaders[len(shaders) - 1])
+
+    def release(self):
+        if self.graph is not None:
+            self.graph.release()
+            self.graph = None
+        if self.target is not None:
+            self.pool.release(self.target)
+            self.target = None
+        self.color_texture = None
+        self.fbo = None
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import deque
+from importlib import resources
+
+
+class ShaderRegistry:
+
+    SHADER_FILES = ("vertex_shader.glsl", "fragment_shader.glsl")
+
+    # effect name -> directory under the packaged SHADERS tree, indexed once per process
+    _index = None
+
+    def __init__(self, ctx, screen_size=(1920, 1080)):
+        # Effects are read and compiled on first use, precompile() + pump() warm them up ahead of time
+        self.ctx = ctx
+        self.screen_size = screen_size
+        self.shaders = {}  # (name, screen size) -> Shader
+        self.pending = deque()  # names whose sources are read, waiting for the GL thread to compile them
+        self.loader = None
+
+    @classmethod
+    def index(cls) -> dict:
+        if cls._index is None:
+            root = resources.files(__package__).joinpath("SHADERS")
+            cls._index = {entry.name: str(entry) for entry in root.iterdir() if entry.is_dir()}
+        return cls._index
+
+    @classmethod
+    def effects(cls) -> list[str]:
+        # Lists the bundled effects without reading a shader or importing moderngl / pygame
+        return sorted(cls.index())
+
+    @classmethod
+    def path(cls, name: str) -> str:
+        path = cls.index().get(name)
+        if path is None:
+            raise KeyError(f"No bundled effect {name}, available: {', '.join(cls.effects())}")
+        return path
+
+    def shader(self, name: str, screen_size=None):
+        screen_size = tuple(screen_size or self.screen_size)
+        shader = self.shaders.get((name, screen_size))
+        if shader is None:
+            # Imported here so listing effects doesn't pull in pygame
+            from .Shader import Shader
+            shader = Shader(ShaderRegistry.path(name), self.ctx, screen_size=screen_size)
+            self.shaders[(name, screen_size)] = shader
+        return shader
+
+    def load_sources(self, name: str, cache=None):
+        from .ShaderCache import ShaderCache
+        if cache is None:
+            cache = ShaderCache.for_context(self.ctx)
+        for file_name in ShaderRegistry.SHADER_FILES:
+            cache.read_source(os.path.join(ShaderRegistry.path(name), file_name), missing_ok=True)
+
+    def precompile(self, names: list[str] = None) -> threading.Thread:
+        # Reads the sources on a background thread. GL calls must stay on the context's thread, so the
+        # programs are compiled by pump(), a few per frame
+        names = list(names) if names is not None else ShaderRegistry.effects()
+        # Looked up here, for_context() isn't safe to race with the GL thread
+        from .ShaderCache import ShaderCache
+        cache = ShaderCache.for_context(self.ctx)
+
+        def load():
+            for name in names:
+                self.load_sources(name, cache)
+                self.pending.append(name)
+
+        self.loader = threading.Thread(target=load, name="ShaderRegistry.precompile", daemon=True)
+        self.loader.start()
+        return self.loader
+
+    def pump(self, budget=0.004) -> bool:
+        # Compiles queued effects for up to budget seconds, True once everything precompile() was given is built
+        loading = self.loader is not None and self.loader.is_alive()
+        start = time.perf_counter()
+        while self.pending and time.perf_counter() - start < budget:
+            self.shader(self.pending.popleft())
+        return not loading and not self.pending
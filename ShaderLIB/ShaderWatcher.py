@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+from .Shader import Shader
+from .ShaderCache import ShaderCache
+
+
+class ShaderWatcher:
+
+    SHADER_FILES = (Shader.VERTEX_SHADER_PREFIX, Shader.FRAGMENT_SHADER_PREFIX)
+
+    def __init__(self, shaders: list[Shader] = (), interval=0.5):
+        # Opt-in hot reload: a background thread polls the mtimes of the GLSL files in each shader's dir_loc
+        # and reads the changed ones, poll() (on the GL thread, e.g. once per frame) compiles and swaps them in.
+        # Shaders built from passed-in sources (e.g. FusedShader) shouldn't be watched, their files aren't theirs
+        self.interval = interval
+        self.shaders = []
+        self.mtimes = {}  # Shader -> mtimes of its files when last read
+        self.pending = {}  # Shader -> (vertex source, fragment source, {path: source}), newest read wins
+        self.errors = {}  # Shader -> compiler log of its last failed reload
+        self.reloads = 0
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.thread = None
+        for shader in shaders:
+            self.watch(shader)
+
+    def watch(self, shader: Shader):
+        with self.lock:
+            if shader not in self.mtimes:
+                self.shaders.append(shader)
+                self.mtimes[shader] = ShaderWatcher.mtimes_of(shader)
+
+    def unwatch(self, shader: Shader):
+        with self.lock:
+            if shader in self.mtimes:
+                self.shaders.remove(shader)
+                del self.mtimes[shader]
+                self.pending.pop(shader, None)
+                self.errors.pop(shader, None)
+
+    @staticmethod
+    def paths_of(shader: Shader) -> list[str]:
+        return [os.path.abspath(os.path.join(shader.dir_loc, file_name)) for file_name in ShaderWatcher.SHADER_FILES]
+
+    @staticmethod
+    def mtimes_of(shader: Shader) -> tuple:
+        # None for a missing file, the shader uses the default pipeline's then
+        mtimes = []
+        for path in ShaderWatcher.paths_of(shader):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    @staticmethod
+    def read_sources(shader: Shader) -> dict:
+        # path -> source of the shader's files, the default pipeline's stand in for missing ones
+        sources = {}
+        for path, file_name in zip(ShaderWatcher.paths_of(shader), ShaderWatcher.SHADER_FILES):
+            if not os.path.exists(path):
+                path = os.path.join(Shader.DEFAULT_SHADER_DIR, file_name)
+            with open(path, "r") as f:
+                sources[os.path.abspath(path)] = f.read()
+        return sources
+
+    def check(self) -> int:
+        # One scan, stats and reads only so it can run off the GL thread. Returns how many shaders changed
+        with self.lock:
+            shaders = [(shader, self.mtimes[shader]) for shader in self.shaders]
+        changed = 0
+        for shader, mtimes in shaders:
+            current = ShaderWatcher.mtimes_of(shader)
+            if current == mtimes:
+                continue
+            try:
+                sources = ShaderWatcher.read_sources(shader)
+            except OSError:
+                # Caught between an editor's delete and write, the next scan picks the file up
+                continue
+            vertex_shader, fragment_shader = sources.values()
+            with self.lock:
+                if shader in self.mtimes:
+                    self.mtimes[shader] = current
+                    self.pending[shader] = (vertex_shader, fragment_shader, sources)
+                    changed += 1
+        return changed
+
+    def start(self) -> threading.Thread:
+        if self.thread is not None and self.thread.is_alive():
+            return self.thread
+        self.running.set()
+
+        def scan():
+            while self.running.is_set():
+                self.check()
+                time.sleep(self.interval)
+
+        self.thread = threading.Thread(target=scan, name="ShaderWatcher", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def poll(self, budget=0.004) -> list[tuple[Shader, str | None]]:
+        # Swaps in the changed shaders for up to budget seconds, call between frames on the GL thread.
+        # Returns (shader, None) per reload and (shader, compiler log) per failure, the shader keeps its
+        # old program then and the error stays in errors until a later edit compiles
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        results = []
+        start = time.perf_counter()
+        for shader, (vertex_shader, fragment_shader, sources) in pending.items():
+            if results and time.perf_counter() - start >= budget:
+                with self.lock:
+                    if shader in self.mtimes:
+                        self.pending.setdefault(shader, (vertex_shader, fragment_shader, sources))
+                continue
+            if shader.reload(vertex_shader, fragment_shader):
+                # Shaders created from the same directory later read the new files too
+                cache = ShaderCache.for_context(shader.ctx)
+                for path, source in sources.items():
+                    cache.set_source(path, source)
+                self.errors.pop(shader, None)
+                self.reloads += 1
+            else:
+                self.errors[shader] = shader.reload_error
+            results.append((shader, shader.reload_error))
+        return results
@@ -0,0 +1,163 @@
+import os
+import weakref
+from array import array
+
+import moderngl
+import pygame
+
+from .Shader import Shader
+
+
+class TextureAtlas:
+
+    def __init__(self, ctx: moderngl.Context, size=(2048, 2048), padding=1):
+        self.ctx = ctx
+        self.size = size
+        self.padding = padding
+        self.texture = ctx.texture(size, 4)
+        self.texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        self.regions = weakref.WeakKeyDictionary()  # pygame.Surface -> (x, y, UV rect)
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    def uv_rect(self, surf: pygame.Surface):
+        # Packs surf on first use, returns None when it no longer fits
+        region = self.regions.get(surf)
+        if region is None:
+            region = self.add(surf)
+        return None if region is None else region[2]
+
+    def add(self, surf: pygame.Surface):
+        w, h = surf.get_size()
+        if w + self.padding > self.size[0] or h + self.padding > self.size[1]:
+            raise ValueError(f"Surface of size {(w, h)} doesn't fit in an atlas of size {self.size}")
+        if self.shelf_x + w > self.size[0]:
+            # Start a new shelf under the tallest surface of the current one
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+        if self.shelf_y + h > self.size[1]:
+            return None
+        x, y = self.shelf_x, self.shelf_y
+        self.shelf_x += w + self.padding
+        self.shelf_height = max(self.shelf_height, h + self.padding)
+        uv = (x / self.size[0], y / self.size[1], (x + w) / self.size[0], (y + h) / self.size[1])
+        region = (x, y, uv)
+        self.regions[surf] = region
+        self.write(surf, x, y)
+        return region
+
+    def update(self, surf: pygame.Surface):
+        # Re-uploads the pixels of a surface that changed after it was packed
+        region = self.regions.get(surf)
+        if region is not None:
+            self.write(surf, region[0], region[1])
+
+    def write(self, surf: pygame.Surface, x: int, y: int):
+        if not surf.get_flags() & pygame.SRCALPHA:
+            # The unused byte of surfaces without per pixel alpha is not 255, give them an alpha channel
+            staging = pygame.Surface(surf.get_size(), pygame.SRCALPHA, 32)
+            staging.blit(surf, (0, 0))
+            surf = staging
+        self.texture.write(pygame.image.tobytes(surf, "RGBA"), viewport=(x, y, *surf.get_size()))
+
+    def clear(self):
+        self.regions.clear()
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    def release(self):
+        self.texture.release()
+
+
+class SpriteBatch:
+
+    DEFAULT_SHADER_DIR = os.path.join(os.path.dirname(__file__), "SHADERS", "sprite_batch_shader")
+
+    # Per instance: pos (2f), size (2f), UV rect (4f), tint (4f)
+    INSTANCE_FLOATS = 12
+
+    def __init__(self, ctx: moderngl.Context, screen_size=(1920, 1080), shader_dir_loc: str = None, atlas_size=(2048, 2048), capacity=10000):
+        self.ctx = ctx
+        self.screen_size = screen_size
+        self.dir_loc = shader_dir_loc if shader_dir_loc is not None else SpriteBatch.DEFAULT_SHADER_DIR
+        self.atlas = TextureAtlas(ctx, atlas_size)
+        self.program = self.ctx.program(vertex_shader=self.get_vertex_shader(), fragment_shader=self.get_fragment_shader())
+        self.program["screen_size"] = self.screen_size
+        self.quads = Shader.create_full_screen_quad(self.ctx)
+        self.capacity = capacity
+        self.instance_buffer = self.ctx.buffer(reserve=capacity * SpriteBatch.INSTANCE_FLOATS * 4)
+        self.instance_data = array('f')
+        self.render_object = self._create_render_object()
+        self.fbo = None
+        self.uniforms = {}
+
+    def begin(self, fbo: moderngl.Framebuffer = None, **kwargs):
+        self.fbo = fbo
+        self.uniforms = kwargs
+        del self.instance_data[:]
+
+    def draw(self, surf: pygame.Surface, pos, size=None, tint=(1.0, 1.0, 1.0, 1.0)):
+        uv = self.atlas.uv_rect(surf)
+        if uv is None:
+            # Atlas is full: draw what references it, then start packing again
+            self.flush()
+            self.atlas.clear()
+            uv = self.atlas.uv_rect(surf)
+        if size is None:
+            size = surf.get_size()
+        self.instance_data.extend((pos[0], pos[1], size[0], size[1], *uv, *tint))
+
+    def draw_packed(self, data):
+        # Appends instances packed by the caller (e.g. a float32 NumPy array), INSTANCE_FLOATS each.
+        # UV rects come from self.atlas.uv_rect(surf)
+        self.instance_data.frombytes(memoryview(data).cast("B"))
+
+    def end(self):
+        self.flush()
+        self.fbo = None
+        self.uniforms = {}
+
+    def flush(self):
+        count = len(self.instance_data) // SpriteBatch.INSTANCE_FLOATS
+        if count == 0:
+            return
+        if count > self.capacity:
+            self.capacity = max(count, self.capacity * 2)
+            self.instance_buffer.orphan(self.capacity * SpriteBatch.INSTANCE_FLOATS * 4)
+        self.instance_buffer.write(self.instance_data)
+
+        fbo = self.fbo if self.fbo is not None else self.ctx.screen
+        fbo.use()
+        self.atlas.texture.use(0)
+        self.program["tex"] = 0
+        for k, v in self.uniforms.items():
+            self.program[k] = v
+        self.render_object.render(mode=moderngl.TRIANGLE_STRIP, instances=count)
+        del self.instance_data[:]
+
+    def release(self):
+        self.render_object.release()
+        self.instance_buffer.release()
+        self.quads.release()
+        self.program.release()
+        self.atlas.release()
+
+    def _create_render_object(self):
+        return self.ctx.vertex_array(self.program, [
+            (self.quads, '8x 2f', 'texcoord'),
+            (self.instance_buffer, '2f 2f 4f 4f/i', 'in_pos', 'in_size', 'in_uv', 'in_tint'),
+        ])
+
+    def get_vertex_shader(self) -> str:
+        with open(os.path.join(SpriteBatch.DEFAULT_SHADER_DIR, Shader.VERTEX_SHADER_PREFIX), "r") as f:
+            return f.read()
+
+    def get_fragment_shader(self) -> str:
+        shader_frag_path = os.path.join(self.dir_loc, Shader.FRAGMENT_SHADER_PREFIX)
+        if not os.path.exists(shader_frag_path):
+            shader_frag_path = os.path.join(SpriteBatch.DEFAULT_SHADER_DIR, Shader.FRAGMENT_SHADER_PREFIX)
+        with open(shader_frag_path, "r") as f:
+            return f.read()
@@ -0,0 +1,137 @@
+import itertools
+import sys
+import weakref
+
+import moderngl
+import pygame
+
+from .ContextLocal import ContextLocal
+
+
+class SurfaceTexture:
+
+    def __init__(self, texture: moderngl.Texture, staging: pygame.Surface = None):
+        self.texture = texture
+        # 32 bit copy used for surfaces whose pixels can't be uploaded as they are
+        self.staging = staging
+        self.version = 0  # stamp of the last upload, see SurfaceTextureCache.version
+        self.finalizer = None  # releases the texture once the surface is collected, detached by forget()
+
+    def release(self):
+        if self.finalizer is not None:
+            self.finalizer.detach()
+        self.texture.release()
+
+
+class SurfaceTextureCache(ContextLocal):
+
+    # Stamps are unique across entries, a forgotten and re-created surface never repeats an old one
+    _versions = itertools.count(1)
+
+    def __init__(self, ctx: moderngl.Context):
+        self.ctx = ctx
+        self.entries = weakref.WeakKeyDictionary()  # pygame.Surface -> SurfaceTexture
+        self.bytes_uploaded = 0
+        self.allocations = 0
+
+    def upload(self, surf: pygame.Surface, dirty_rect=None) -> moderngl.Texture:
+        # dirty_rect=None uploads the whole surface, an empty rect skips the upload
+        entry = self.entries.get(surf)
+        if entry is None or entry.texture.size != surf.get_size():
+            if entry is not None:
+                entry.release()
+            entry = self._create_entry(surf)
+            self.entries[surf] = entry
+            dirty_rect = None
+
+        if dirty_rect is None:
+            rect = pygame.Rect((0, 0), surf.get_size())
+        else:
+            rect = pygame.Rect(dirty_rect).clip(surf.get_rect())
+            if rect.width == 0 or rect.height == 0:
+                return entry.texture
+
+        source = surf
+        if entry.staging is not None:
+            entry.staging.fill((0, 0, 0, 0), rect)
+            entry.staging.blit(surf, rect, rect)
+            source = entry.staging
+
+        view = source.get_view("0")
+        data = SurfaceTextureCache.rect_bytes(memoryview(view).cast("B"), source.get_pitch(), 4, rect)
+        entry.texture.write(data, viewport=tuple(rect))
+        del view
+        entry.version = SurfaceTextureCache.next_version()
+        self.bytes_uploaded += rect.width * rect.height * 4
+        return entry.texture
+
+    @staticmethod
+    def next_version() -> int:
+        return next(SurfaceTextureCache._versions)
+
+    def version(self, surf: pygame.Surface):
+        # Changes with every upload that writes texels, None for surfaces that were never uploaded
+        entry = self.entries.get(surf)
+        return None if entry is None else entry.version
+
+    def forget(self, surf: pygame.Surface):
+        entry = self.entries.pop(surf, None)
+        if entry is not None:
+            entry.release()
+
+    def clear(self):
+        for surf in list(self.entries.keys()):
+            self.forget(surf)
+
+    def _create_entry(self, surf: pygame.Surface) -> SurfaceTexture:
+        tex = self.ctx.texture(surf.get_size(), 4)
+        tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        tex.repeat_x = False
+        tex.repeat_y = False
+        self.allocations += 1
+        if SurfaceTextureCache.is_uploadable(surf):
+            tex.swizzle = SurfaceTextureCache.swizzle_for(surf)
+            entry = SurfaceTexture(tex)
+        else:
+            staging = pygame.Surface(surf.get_size(), pygame.SRCALPHA, 32)
+            tex.swizzle = SurfaceTextureCache.swizzle_for(staging)
+            entry = SurfaceTexture(tex, staging)
+        # The weak entry goes with the surface but moderngl doesn't free GL objects on collection, surfaces
+        # made every frame (text, transform.scale results) would leak a texture each
+        entry.finalizer = weakref.finalize(surf, tex.release)
+        return entry
+
+    @staticmethod
+    def is_uploadable(surf: pygame.Surface) -> bool:
+        # 32 bit pixels without colorkey or surface alpha can go to the GPU byte for byte. Subsurfaces
+        # (e.g. sprite sheet frames) share their parent's rows, which get_view() refuses, so they're staged
+        if surf.get_parent() is not None:
+            return False
+        if surf.get_bytesize() != 4:
+            return False
+        if surf.get_colorkey() is not None:
+            return False
+        alpha = surf.get_alpha()
+        return alpha is None or alpha == 255
+
+    @staticmethod
+    def swizzle_for(surf: pygame.Surface) -> str:
+        swizzle = ""
+        for mask in surf.get_masks():
+            if mask == 0:
+                swizzle += "1"
+                continue
+            byte = (mask & -mask).bit_length() // 8
+            if sys.byteorder == "big":
+                byte = 3 - byte
+            swizzle += "RGBA"[byte]
+        return swizzle
+
+    @staticmethod
+    def rect_bytes(data: memoryview, pitch: int, bytesize: int, rect: pygame.Rect):
+        # Rows of the rectangle packed tightly, without a copy when they already are
+        row = rect.width * bytesize
+        start = rect.y * pitch + rect.x * bytesize
+        if row == pitch:
+            return data[start:start + row * rect.height]
+        return b"".join(data[start + r * pitch:start + r * pitch + row] for r in range(rect.height))
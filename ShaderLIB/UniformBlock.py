@@ -0,0 +1,56 @@
+import struct
+
+import moderngl
+
+
+class UniformBlock:
+
+    # GLSL type -> (std140 base alignment, size, struct format)
+    STD140_TYPES = {
+        "float": (4, 4, "f"),
+        "int": (4, 4, "i"),
+        "uint": (4, 4, "I"),
+        "vec2": (8, 8, "2f"),
+        "vec3": (16, 12, "3f"),
+        "vec4": (16, 16, "4f"),
+        "ivec2": (8, 8, "2i"),
+        "ivec4": (16, 16, "4i"),
+        "mat4": (16, 64, "16f"),
+    }
+
+    def __init__(self, ctx: moderngl.Context, name: str, fields: list[tuple[str, str]], binding: int = 0):
+        # fields are (name, GLSL type) in declaration order, laid out with std140 rules
+        self.ctx = ctx
+        self.name = name
+        self.binding = binding
+        self.offsets = {}
+        offset = 0
+        for field_name, glsl_type in fields:
+            alignment, size, fmt = UniformBlock.STD140_TYPES[glsl_type]
+            offset = (offset + alignment - 1) // alignment * alignment
+            self.offsets[field_name] = (offset, "<" + fmt)
+            offset += size
+        self.size = (offset + 15) // 16 * 16
+        self.data = bytearray(self.size)
+        self.buffer = ctx.buffer(reserve=self.size)
+        self.writes = 0
+
+    @classmethod
+    def frame_globals(cls, ctx: moderngl.Context, binding: int = 0) -> "UniformBlock":
+        # Matches: uniform FrameGlobals { float time; vec2 resolution; };
+        return cls(ctx, "FrameGlobals", [("time", "float"), ("resolution", "vec2")], binding)
+
+    def update(self, **values):
+        # Packs every value and writes the block once, for all the programs that read it
+        for name, value in values.items():
+            offset, fmt = self.offsets[name]
+            if isinstance(value, (int, float)):
+                struct.pack_into(fmt, self.data, offset, value)
+            else:
+                struct.pack_into(fmt, self.data, offset, *value)
+        self.buffer.write(self.data)
+        self.buffer.bind_to_uniform_block(self.binding)
+        self.writes += 1
+
+    def release(self):
+        self.buffer.release()
@@ -0,0 +1,5 @@
+# Every class lives in the module of the same name (from ShaderLIB.Shader import Shader). Importing the
+# package itself only brings in the registry, listing effects stays free of moderngl and pygame
+from .ShaderRegistry import ShaderRegistry
+
+effects = ShaderRegistry.effects